@@ -1,11 +1,13 @@
+import asyncio
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 from typing import List, Optional
 
 from app.models.schemas import UploadResponse, AskRequest, AskResponse
 from app.services.ingestion import IngestionService
 from app.services.rag import RAGService
+from app.services.query_cache import SemanticAnswerCache
 from app.core.config import settings
 
 # Set up logging
@@ -13,15 +15,21 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_ingestion_service() -> IngestionService:
-    return IngestionService(vector_store_path=settings.vector_store_path)
+# Process-wide cache of answers keyed on query embeddings
+answer_cache = SemanticAnswerCache(
+    threshold=settings.answer_cache_threshold,
+    ttl=settings.answer_cache_ttl,
+    max_size=settings.answer_cache_max_size
+)
+
+def get_ingestion_service(request: Request) -> IngestionService:
+    return request.app.state.ingestor
 
-def get_rag_service() -> RAGService:
-    return RAGService(vector_store_path=settings.vector_store_path)
+def get_rag_service(request: Request) -> RAGService:
+    return request.app.state.rag
 
 @router.post(
     "/upload",
-    response_model=UploadResponse,
     summary="Upload Document",
     description="""
     Upload a document to be processed and indexed by the RAG system.
@@ -31,8 +39,9 @@ def get_rag_service() -> RAGService:
     """,
     response_description="Document processing status and metadata",
     responses={
-        200: {"description": "Document processed successfully"},
+        200: {"model": UploadResponse, "description": "Document processed successfully"},
         400: {"description": "Invalid or missing file"},
+        413: {"description": "File exceeds the maximum upload size"},
         500: {"description": "Error processing document"}
     }
 )
@@ -55,12 +64,17 @@ async def upload_document(
     
     try:
         doc_id = await ingestor.ingest_file(file)
-        return {
+        # Cached answers may be stale now that the corpus changed
+        answer_cache.clear()
+        # Built from trusted values, so skip response model validation
+        return ORJSONResponse({
             "document_id": doc_id,
             "filename": file.filename,
             "status": "ingested",
             "message": "Document processed successfully"
-        }
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing document {file.filename}: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -68,9 +82,69 @@ async def upload_document(
             detail=f"Error processing document: {str(e)}"
         )
 
+@router.post(
+    "/upload_batch",
+    response_model=List[UploadResponse],
+    summary="Upload Documents",
+    description="""
+    Upload several documents in one request.
+    
+    Files are ingested concurrently (up to the configured ingest concurrency) and each
+    one gets its own status, so a failing file does not fail the whole batch.
+    """,
+    response_description="Processing status and metadata for each document",
+    responses={
+        200: {"description": "Batch processed, see the status of each document"},
+        422: {"description": "Missing files"}
+    }
+)
+async def upload_documents(
+    files: List[UploadFile] = File(..., description="Document files to upload and process"),
+    ingestor: IngestionService = Depends(get_ingestion_service)
+):
+    """
+    Upload and process several documents for the RAG system.
+    
+    - **files**: The document files to be processed
+    - **returns**: One processing status per file, in upload order
+    """
+    semaphore = asyncio.Semaphore(settings.ingest_concurrency)
+    
+    async def ingest_one(file: UploadFile) -> str:
+        if not file.filename:
+            raise ValueError("Missing filename")
+        async with semaphore:
+            logger.info(f"Processing uploaded file: {file.filename}")
+            return await ingestor.ingest_file(file)
+    
+    results = await asyncio.gather(*(ingest_one(f) for f in files), return_exceptions=True)
+    
+    responses = []
+    for file, result in zip(files, results):
+        if isinstance(result, BaseException):
+            detail = result.detail if isinstance(result, HTTPException) else str(result)
+            logger.error(f"Error processing document {file.filename}: {detail}")
+            responses.append({
+                "document_id": None,
+                "filename": file.filename or "",
+                "status": "failed",
+                "message": detail
+            })
+        else:
+            responses.append({
+                "document_id": result,
+                "filename": file.filename,
+                "status": "ingested",
+                "message": "Document processed successfully"
+            })
+    
+    if any(r["status"] == "ingested" for r in responses):
+        # Cached answers may be stale now that the corpus changed
+        answer_cache.clear()
+    return responses
+
 @router.post(
     "/ask",
-    response_model=AskResponse,
     summary="Ask a Question",
     description="""
     Ask a natural language question and get an answer based on the indexed documents.
@@ -79,7 +153,7 @@ async def upload_document(
     """,
     response_description="Answer to the question with source references",
     responses={
-        200: {"description": "Successfully generated answer"},
+        200: {"model": AskResponse, "description": "Successfully generated answer"},
         500: {"description": "Error processing question"}
     }
 )
@@ -99,19 +173,32 @@ async def ask(
     try:
         logger.info(f"Processing question: {request.question}")
         
-        answer, sources = await rag.answer_query(
-            query=request.question,
-            top_k=request.top_k
-        )
+        # Embed once and share the vector between the cache lookup and retrieval
+        query_embedding = await rag.embed_query(request.question)
+        
+        cached = answer_cache.lookup(query_embedding, request.top_k)
+        if cached is not None:
+            logger.info("Serving answer from cache")
+            answer, sources = cached
+        else:
+            answer, sources = await rag.answer_query(
+                query=request.question,
+                top_k=request.top_k,
+                query_embedding=query_embedding
+            )
+            # Only cache answers backed by sources, not fallbacks or errors
+            if sources:
+                answer_cache.store(query_embedding, request.top_k, answer, sources)
         
         # Extract source information
         source_texts = [s["source"] for s in sources if s.get("source")]
         
-        return AskResponse(
-            answer=answer,
-            sources=source_texts,
-            relevant_docs=None  # Can be populated if tracking document IDs
-        )
+        # Built from trusted values, so skip response model validation
+        return ORJSONResponse({
+            "answer": answer,
+            "sources": source_texts,
+            "relevant_docs": None  # Can be populated if tracking document IDs
+        })
         
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}", exc_info=True)
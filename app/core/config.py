@@ -11,18 +11,58 @@ class Settings(BaseSettings):
     app_host: str = Field("0.0.0.0", env="APP_HOST")
     app_port: int = Field(8000, env="APP_PORT")
     api_version: str = Field("0.1.0", env="API_VERSION")
+    # Compute-heavy calls (embedding forward pass, FAISS search, generation) running at
+    # once; BLAS/OpenMP threads are split between them. The embedding model runs on one
+    # thread and search/generation on the event loop, so one process rarely runs more
+    # than one at a time and 1 keeps every core busy. Raise it when several worker
+    # processes share the host's cores (e.g. uvicorn --workers 4).
+    request_concurrency: int = Field(1, env="REQUEST_CONCURRENCY")
 
     # -------------------------------
     # HuggingFace Embeddings
     # -------------------------------
     hf_model_name: str = Field("all-MiniLM-L6-v2", env="HF_MODEL_NAME")
     hf_batch_size: int = Field(32, env="HF_BATCH_SIZE")
+    embedding_batch_size: int = Field(128, env="EMBEDDING_BATCH_SIZE")  # chunks per ingestion batch
+    embed_backend: str = Field("torch", env="EMBED_BACKEND")  # torch | compile | onnx | onnx-int8
+    embed_onnx_file: str = Field("onnx/model_quint8_avx2.onnx", env="EMBED_ONNX_FILE")
+    # Concurrent queries are embedded together if they arrive within this window
+    query_batch_wait_ms: float = Field(5.0, env="QUERY_BATCH_WAIT_MS")
+    query_batch_max_tokens: int = Field(2048, env="QUERY_BATCH_MAX_TOKENS")
+
+    # -------------------------------
+    # LLM
+    # -------------------------------
+    llm_backend: str = Field("local", env="LLM_BACKEND")  # local | vllm
+    llm_model_name: str = Field("gpt2", env="LLM_MODEL_NAME")
+    llm_url: str = Field("http://localhost:8001", env="LLM_URL")  # used by the vllm backend
+    llm_compile: bool = Field(False, env="LLM_COMPILE")  # torch.compile the generation forward pass
+
+    # -------------------------------
+    # Query caches
+    # -------------------------------
+    answer_cache_threshold: float = Field(0.97, env="ANSWER_CACHE_THRESHOLD")
+    answer_cache_ttl: float = Field(600.0, env="ANSWER_CACHE_TTL")
+    answer_cache_max_size: int = Field(2000, env="ANSWER_CACHE_MAX_SIZE")
+    query_embedding_cache_size: int = Field(4096, env="QUERY_EMBEDDING_CACHE_SIZE")
+    query_embedding_cache_dir: Path = Field(default=Path("./data/query_embeddings"), env="QUERY_EMBEDDING_CACHE_DIR")
+    query_embedding_cache_ttl: float = Field(7 * 86400, env="QUERY_EMBEDDING_CACHE_TTL")
+    query_embedding_cache_max_entries: int = Field(100000, env="QUERY_EMBEDDING_CACHE_MAX_ENTRIES")
 
     # -------------------------------
     # File storage / vector store
     # -------------------------------
     vector_store_path: Path = Field(default=Path("./data/vector_store"), env="VECTOR_STORE_PATH")
     upload_dir: Path = Field(default=Path("./data/uploads"), env="UPLOAD_DIR")
+    max_upload_mb: int = Field(100, env="MAX_UPLOAD_MB")
+    ingest_concurrency: int = Field(4, env="INGEST_CONCURRENCY")  # files ingested in parallel by /upload_batch
+    vector_index_type: str = Field("flat", env="VECTOR_INDEX_TYPE")  # flat | fp16 | sq8 | hnsw | ivfpq
+    vector_index_train_size: int = Field(10000, env="VECTOR_INDEX_TRAIN_SIZE")
+    hnsw_ef_search: int = Field(64, env="HNSW_EF_SEARCH")  # lower = faster, less recall
+    ivf_nprobe: int = Field(8, env="IVF_NPROBE")  # IVF lists scanned per query
+    # Ingestion writes the vector store at most every N seconds, or sooner after M new vectors
+    vector_store_flush_interval: float = Field(5.0, env="VECTOR_STORE_FLUSH_INTERVAL")
+    vector_store_flush_every: int = Field(10000, env="VECTOR_STORE_FLUSH_EVERY")
 
     # -------------------------------
     # Database (optional)
@@ -0,0 +1,58 @@
+"""
+SQLite-backed repositories for DocAsk.
+"""
+
+import sqlite3
+import logging
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_path(database_url: str) -> Path:
+    """Turn a sqlite:/// database URL into a filesystem path."""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise ValueError(f"Only sqlite:/// database URLs are supported, got: {database_url}")
+    return Path(database_url[len(prefix):])
+
+
+class DocumentHashRepository:
+    """Maps the content hash of an ingested file to the ID of its document."""
+
+    def __init__(self, db_path: Optional[Path] = None):
+        """
+        Args:
+            db_path: SQLite database file (defaults to settings.database_url)
+        """
+        self.db_path = Path(db_path) if db_path else sqlite_path(settings.database_url)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_hashes ("
+                "content_hash TEXT PRIMARY KEY, doc_id TEXT NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps the repository usable from worker threads
+        return sqlite3.connect(self.db_path)
+
+    def get_doc_id(self, content_hash: str) -> Optional[str]:
+        """Return the document ID stored for a content hash, if any."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT doc_id FROM document_hashes WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, content_hash: str, doc_id: str) -> None:
+        """Record (or replace) the document ID for a content hash."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO document_hashes (content_hash, doc_id) VALUES (?, ?)",
+                (content_hash, doc_id)
+            )
@@ -1,6 +1,79 @@
+import os
+import logging
+from app.core.config import settings
+
+# Split the cores between the compute-heavy calls that can run at once (see
+# settings.request_concurrency) instead of oversubscribing them. This must happen
+# before torch/faiss are imported.
+NUM_THREADS = str(max(1, (os.cpu_count() or 1) // max(1, settings.request_concurrency)))
+os.environ.setdefault("OMP_NUM_THREADS", NUM_THREADS)
+os.environ.setdefault("MKL_NUM_THREADS", NUM_THREADS)
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+import faiss
+import torch
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from app.api.v1.endpoints import router as v1_router
-from app.core.config import settings
+from app.services.ingestion import IngestionService
+from app.services.rag import RAGService
 
-app = FastAPI(title="RAG-QA", version="0.1.0")
+faiss.omp_set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    # Only allowed once, before any inter-op parallel work has started
+    pass
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="RAG-QA", version="0.1.0", default_response_class=ORJSONResponse)
 app.include_router(v1_router, prefix="/api/v1")
+
+
+@app.on_event("startup")
+def init_services():
+    """Build the process-wide services once instead of per request."""
+    ingestor = IngestionService(vector_store_path=settings.vector_store_path)
+    # Share the embedding model and vector store so /ask sees new uploads immediately
+    app.state.ingestor = ingestor
+    app.state.rag = RAGService(
+        emb_provider=ingestor.embedding_provider,
+        vector_store=ingestor.vector_store
+    )
+
+    # Load and warm up the embedding model now so the first request doesn't pay for it
+    try:
+        ingestor.embedding_provider.warmup()
+    except RuntimeError as e:
+        logger.warning(f"Embedding model not preloaded, it will be loaded on first use: {str(e)}")
+
+    # Drop query embeddings that expired while the service was down
+    try:
+        app.state.rag.embedding_cache.sweep()
+    except OSError as e:
+        logger.warning(f"Could not clean up the query embedding cache: {str(e)}")
+
+    # Likewise tokenize the static prompt prefix and compute its KV cache once
+    try:
+        app.state.rag.warmup()
+    except Exception as e:
+        logger.warning(f"LLM not preloaded, it will be loaded on first use: {str(e)}")
+
+
+@app.on_event("shutdown")
+async def flush_vector_store():
+    """Write any vector store changes still waiting for a batched flush."""
+    ingestor = getattr(app.state, "ingestor", None)
+    if ingestor is not None:
+        await ingestor.flush()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    """Close the pooled HTTP client of a remote LLM backend."""
+    rag = getattr(app.state, "rag", None)
+    aclose = getattr(getattr(rag, "llm", None), "aclose", None)
+    if callable(aclose):
+        await aclose()
@@ -12,7 +12,7 @@ from pydantic import BaseModel, Field
 # -------------------------------
 class UploadResponse(BaseModel):
     """Response after uploading and processing a document."""
-    document_id: str = Field(..., description="Unique ID assigned to the uploaded document")
+    document_id: Optional[str] = Field(None, description="Unique ID assigned to the uploaded document (None if processing failed)")
     filename: str = Field(..., description="Original name of the uploaded file")
     status: str = Field(..., description="Processing status (e.g., 'success', 'failed')")
     message: Optional[str] = Field(None, description="Additional info or error message")
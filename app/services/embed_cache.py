@@ -0,0 +1,110 @@
+import os
+import time
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingCache:
+    """
+    Content-addressed on-disk cache of query embeddings.
+
+    Each embedding is stored as ``<root>/<key[:2]>/<key>.npy`` where ``key`` is the
+    BLAKE2b digest of the exact query bytes and the embedding model ID, so entries
+    survive restarts and are shared by every worker using the same directory.
+    Expired and excess entries are removed by sweep(), which runs every
+    ``max_entries // 10`` writes.
+    """
+
+    def __init__(self, root: Optional[Union[str, Path]] = None, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        """
+        Args:
+            root: cache directory (defaults to settings.query_embedding_cache_dir)
+            ttl: time-to-live of an entry in seconds (defaults to settings.query_embedding_cache_ttl)
+            max_entries: number of entries kept by sweep(), newest first
+                (defaults to settings.query_embedding_cache_max_entries)
+        """
+        self.root = Path(root or settings.query_embedding_cache_dir)
+        self.ttl = settings.query_embedding_cache_ttl if ttl is None else ttl
+        self.max_entries = settings.query_embedding_cache_max_entries if max_entries is None else max_entries
+        self._puts_until_sweep = self._sweep_interval()
+
+    @staticmethod
+    def key(query: str, model_id: str) -> str:
+        """Hex digest addressing the embedding of ``query`` under ``model_id``."""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(model_id.encode("utf-8"))
+        h.update(b"\0")
+        h.update(query.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, query: str, model_id: str) -> Optional[np.ndarray]:
+        """Return the cached embedding, or None if it is missing or expired."""
+        path = self._path(self.key(query, model_id))
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return np.load(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable query embedding cache entry {path}: {str(e)}")
+            return None
+
+    def put(self, query: str, model_id: str, embedding: np.ndarray) -> None:
+        """Store an embedding (atomically, so concurrent readers never see partial files)."""
+        path = self._path(self.key(query, model_id))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(embedding, dtype=np.float32))
+        os.replace(tmp_path, path)
+        
+        self._puts_until_sweep -= 1
+        if self._puts_until_sweep <= 0:
+            self._puts_until_sweep = self._sweep_interval()
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Delete expired entries, then the oldest ones beyond max_entries.
+        
+        Returns:
+            Number of entries deleted
+        """
+        now = time.time()
+        removed = 0
+        entries = []
+        for path in self.root.glob("*/*.npy"):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue  # removed by another worker
+            if now - mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((mtime, path))
+                
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                path.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} entries from the query embedding cache at {self.root}")
+        return removed
+
+    def _sweep_interval(self) -> int:
+        return max(1, self.max_entries // 10)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npy"
@@ -1,6 +1,7 @@
 import logging
 import asyncio
-from typing import List, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any
 
 import traceback
 
@@ -14,17 +15,24 @@ except ImportError as e:
     ) from e
 
 try:
+    import torch
     from sentence_transformers import SentenceTransformer
+    from sentence_transformers.util import batch_to_device
 except ImportError as e:
     raise ImportError(
         "sentence-transformers is required but not installed. "
         "Please install it with: pip install sentence-transformers"
     ) from e
 
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
+# Supported inference backends for HFEmbeddingProvider
+EMBED_BACKENDS = ("torch", "compile", "onnx", "onnx-int8")
+
 class EmbeddingProvider:
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
         raise NotImplementedError
 
 
@@ -37,23 +45,43 @@ class HFEmbeddingProvider(EmbeddingProvider):
     Fully local and free.
     """
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 32):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 32,
+                 backend: Optional[str] = None):
         """
         Args:
             model_name: pre-trained SentenceTransformer model
             batch_size: number of texts per batch
+            backend: "torch" (eager PyTorch), "compile" (torch.compile), "onnx" (ONNX
+                Runtime) or "onnx-int8" (ONNX Runtime with int8 weights); defaults to
+                settings.embed_backend
         """
+        backend = backend or settings.embed_backend
+        if backend not in EMBED_BACKENDS:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+            
         self.model_name = model_name
         self.batch_size = batch_size
+        self.backend = backend
         self._model: Optional[SentenceTransformer] = None
+        # Serialize encode() calls on one thread so concurrent requests don't
+        # each spin up a full set of PyTorch intra-op threads
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        # Tokenization runs on its own thread so it overlaps with inference; one
+        # thread, since a fast tokenizer can't be called concurrently
+        self._tokenizer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenize")
         
+    @property
+    def model_id(self) -> str:
+        """Identifies the embedding space (model and backend) for caches."""
+        return f"{self.model_name}:{self.backend}"
+
     @property
     def model(self) -> SentenceTransformer:
         """Lazy load the model to avoid loading it during import."""
         if self._model is None:
-            logger.info(f"Loading sentence transformer model: {self.model_name}")
+            logger.info(f"Loading sentence transformer model: {self.model_name} ({self.backend} backend)")
             try:
-                self._model = SentenceTransformer(self.model_name)
+                self._model = self._load_model()
             except Exception as e:
                 logger.error(f"Failed to load model {self.model_name}: {str(e)}")
                 raise RuntimeError(
@@ -62,79 +90,176 @@ class HFEmbeddingProvider(EmbeddingProvider):
                 ) from e
         return self._model
 
-    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    def _load_model(self) -> SentenceTransformer:
+        if self.backend == "onnx":
+            # Requires optimum[onnxruntime]; loads onnx/model.onnx, exporting it if
+            # the model repository has none
+            return SentenceTransformer(self.model_name, backend="onnx")
+            
+        if self.backend == "onnx-int8":
+            # Requires optimum[onnxruntime]; uses the dynamically quantized export
+            return SentenceTransformer(
+                self.model_name,
+                backend="onnx",
+                model_kwargs={"file_name": settings.embed_onnx_file}
+            )
+            
+        model = SentenceTransformer(self.model_name)
+        if self.backend == "compile":
+            # dynamic=True avoids recompiling for every padded sequence length
+            model[0].auto_model = torch.compile(model[0].auto_model, dynamic=True)
+        return model
+
+    def warmup(self) -> None:
+        """Load the model and run a first encode so later requests hit a warm model."""
+        self.model.encode(["warmup"], show_progress_bar=False)
+
+    async def embed_texts(self, texts: List[str]) -> np.ndarray:
         """
         Embed a list of texts using the SentenceTransformer model.
 
+        Texts are split into length-sorted batches; each batch is tokenized on the
+        tokenizer thread while the inference thread runs the forward pass of the
+        previous one.
+
         Args:
             texts: list of text strings
 
         Returns:
-            List of embedding vectors (lists of floats)
+            Contiguous float32 array of shape (len(texts), dim)
             
         Raises:
             RuntimeError: If there's an error during embedding
         """
         if not texts:
-            return []
+            return np.empty((0, 0), dtype=np.float32)
             
+        tokenized = []
         try:
-            # Run the synchronous embedding in a thread pool
+            logger.info(f"Starting to embed {len(texts)} texts in batches of {self.batch_size}")
             loop = asyncio.get_running_loop()
-            return await loop.run_in_executor(
-                None,  # Use default thread pool
-                self._embed_texts_sync,
-                texts
-            )
+            
+            # Longest first, like encode(), so texts in a batch pad to similar lengths
+            order = np.argsort([-len(text) for text in texts], kind="stable")
+            tokenized = [
+                loop.run_in_executor(
+                    self._tokenizer_executor,
+                    self._tokenize_sync,
+                    [texts[i] for i in order[start:start + self.batch_size]]
+                )
+                for start in range(0, len(texts), self.batch_size)
+            ]
+            
+            outputs = []
+            for features in tokenized:
+                outputs.append(await loop.run_in_executor(self._executor, self._forward_sync, await features))
+                
+            embeddings = np.empty((len(texts), outputs[0].shape[1]), dtype=np.float32)
+            embeddings[order] = np.vstack(outputs)
+            logger.info(f"Successfully embedded {len(embeddings)} texts")
+            return embeddings
         except Exception as e:
+            for features in tokenized:
+                features.cancel()
             logger.error(traceback.format_exc())
             logger.error(f"Error generating embeddings: {str(e)}", exc_info=True)
             raise RuntimeError(f"Failed to generate embeddings: {str(e)}") from e
 
     # -------------------------------
-    # Internal synchronous embedding
+    # Internal synchronous stages
     # -------------------------------
-    def _embed_texts_sync(self, texts: List[str]) -> List[List[float]]:
-        """Synchronous method to embed texts in batches.
+    def _tokenize_sync(self, texts: List[str]) -> Dict[str, Any]:
+        """Tokenize one batch of texts (runs on the tokenizer thread)."""
+        # preprocess() supersedes tokenize() in newer sentence-transformers
+        preprocess = getattr(self.model, "preprocess", None) or self.model.tokenize
+        return preprocess(texts)
+
+    def _forward_sync(self, features: Dict[str, Any]) -> np.ndarray:
+        """Run the model on one tokenized batch (runs on the inference thread).
         
+        Returns:
+            L2-normalized float32 array of shape (batch, dim)
+        """
+        with torch.inference_mode():
+            features = batch_to_device(features, self.model.device)
+            embeddings = self.model(features)["sentence_embedding"]
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        return embeddings.float().cpu().numpy()
+
+
+# -------------------------------
+# Query micro-batching
+# -------------------------------
+class AsyncEmbeddingBatcher:
+    """
+    Coalesce concurrent single-text embedding requests into batched calls.
+
+    Texts submitted within ``max_wait`` seconds of the first queued one (or until
+    about ``max_tokens`` tokens are queued) are embedded by a single
+    ``embed_texts`` call, so concurrent queries share one forward pass instead
+    of queueing one by one on the inference thread.
+    """
+
+    def __init__(self, provider: EmbeddingProvider, max_wait: float = 0.005, max_tokens: int = 2048):
+        """
         Args:
-            texts: List of text strings to embed
-            
+            provider: embedding provider used for the batched calls
+            max_wait: seconds to wait for more texts after the first one arrives
+            max_tokens: flush early once the queued texts reach about this many tokens
+        """
+        self.provider = provider
+        self.max_wait = max_wait
+        self.max_tokens = max_tokens
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, text: str) -> np.ndarray:
+        """
+        Embed one text as part of the next batch.
+
         Returns:
-            List of embedding vectors
-            
-        Raises:
-            RuntimeError: If there's an error during embedding
+            The float32 embedding of ``text``
         """
-        if not texts:
-            return []
-            
-        try:
-            embeddings: List[List[float]] = []
-            total_texts = len(texts)
-            
-            logger.info(f"Starting to embed {total_texts} texts in batches of {self.batch_size}")
-            
-            # Process in batches
-            for i in range(0, total_texts, self.batch_size):
-                batch = texts[i: i + self.batch_size]
-                logger.debug(f"Processing batch {i//self.batch_size + 1}/{(total_texts + self.batch_size - 1)//self.batch_size}")
-                
-                # Generate embeddings
-                batch_embeddings = self.model.encode(
-                    batch,
-                    show_progress_bar=False,
-                    convert_to_numpy=True,
-                    convert_to_tensor=False,
-                    normalize_embeddings=True
-                )
-                
-                # Convert to list of lists
-                embeddings.extend(batch_embeddings.tolist())
-            
-            logger.info(f"Successfully embedded {len(embeddings)} texts")
-            return embeddings
-            
-        except Exception as e:
-            logger.error(f"Error in _embed_texts_sync: {str(e)}", exc_info=True)
-            raise RuntimeError(f"Failed to generate text embeddings: {str(e)}") from e
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._flush_loop(self._queue))
+
+        future = loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    async def _flush_loop(self, queue: asyncio.Queue) -> None:
+        """Collect queued texts into batches and resolve their futures."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            tokens = self._approx_tokens(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while tokens < self.max_tokens:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                tokens += self._approx_tokens(item[0])
+
+            try:
+                embeddings = await self.provider.embed_texts([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+    @staticmethod
+    def _approx_tokens(text: str) -> int:
+        """Cheap token estimate (word pieces run ~1.3 per whitespace word)."""
+        return len(text.split()) * 4 // 3 + 2
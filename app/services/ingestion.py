@@ -1,39 +1,75 @@
+import os
 import uuid
+import asyncio
+import hashlib
 import logging
+import tempfile
 from typing import List, Optional, Dict, Any
 from pathlib import Path
 
+import numpy as np
+import orjson
+from fastapi import HTTPException
+
 from app.utils.text import chunk_text
+from app.utils.file_utils import extract_text_from_file
 from app.services.embeddings import HFEmbeddingProvider, EmbeddingProvider
 from app.services.vector_store import FaissVectorStore, VectorStore
+from app.db.repo import DocumentHashRepository
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Size of the pieces an upload is streamed to disk in
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
 class IngestionService:
     def __init__(
         self, 
         embedding_provider: Optional[EmbeddingProvider] = None, 
         vector_store: Optional[VectorStore] = None,
-        vector_store_path: Optional[Path] = None
+        vector_store_path: Optional[Path] = None,
+        cache_dir: Optional[Path] = None,
+        hash_repository: Optional[DocumentHashRepository] = None
     ):
         """Initialize the ingestion service.
         
         Args:
             embedding_provider: Provider for generating embeddings
             vector_store: Vector store for storing document chunks
-            vector_store_path: Path to store the vector store (defaults to settings.VECTOR_STORE_PATH)
+            vector_store_path: Path to store the vector store (defaults to settings.vector_store_path)
+            cache_dir: Directory for per-file chunk/embedding caches (defaults to <vector_store_path>/cache)
+            hash_repository: Content hash -> document ID index (defaults to settings.database_url)
         """
         self.embedding_provider = embedding_provider or HFEmbeddingProvider()
+        vs_path = Path(vector_store_path or settings.vector_store_path)
         
         # Initialize vector store with persistence
         if vector_store is None:
-            vs_path = vector_store_path or settings.VECTOR_STORE_PATH
             vs_path.mkdir(parents=True, exist_ok=True)
             logger.info(f"Initializing vector store at {vs_path}")
-            self.vector_store = FaissVectorStore(dim=384, persist_path=str(vs_path))  # all-MiniLM-L6-v2 uses 384 dim
+            self.vector_store = FaissVectorStore(  # all-MiniLM-L6-v2 uses 384 dim
+                dim=384,
+                persist_path=str(vs_path),
+                index_type=settings.vector_index_type,
+                train_size=settings.vector_index_train_size,
+                ef_search=settings.hnsw_ef_search,
+                nprobe=settings.ivf_nprobe
+            )
         else:
             self.vector_store = vector_store
+            
+        # Re-uploads of identical files reuse their stored chunks and embeddings
+        self.cache_dir = Path(cache_dir) if cache_dir else vs_path / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hash_repository = hash_repository or DocumentHashRepository()
+            
+        # Vector store writes are batched; see _schedule_flush
+        self._unflushed = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        
+        # Content hash -> ingestion in progress, so concurrent duplicates ingest once
+        self._in_flight: Dict[str, asyncio.Future] = {}
 
     async def ingest_file(self, upload_file) -> str:
         """Process and ingest an uploaded file.
@@ -46,87 +82,272 @@ class IngestionService:
             
         Raises:
             ValueError: If the file is empty or invalid
-            HTTPException: For any processing errors
+            HTTPException: 413 if the file exceeds settings.max_upload_mb,
+                500 for any other processing error
         """
-        from fastapi import HTTPException
-        from pathlib import Path
-        import tempfile
-        from app.utils.file_utils import extract_text_from_file, save_uploaded_file
-        
         if not upload_file.filename:
             raise ValueError("No filename provided")
             
+        max_bytes = settings.max_upload_mb * 1024 * 1024
+        too_large = HTTPException(
+            status_code=413,
+            detail=f"File exceeds the maximum upload size of {settings.max_upload_mb} MB"
+        )
+        if upload_file.size is not None and upload_file.size > max_bytes:
+            raise too_large
+            
         try:
             # Save the uploaded file to a temporary location
             with tempfile.TemporaryDirectory() as temp_dir:
                 temp_path = Path(temp_dir) / upload_file.filename
                 
-                # Save the uploaded file
+                # Stream the upload to disk instead of buffering it all in memory,
+                # hashing it on the way for the content cache
+                size = 0
+                hasher = hashlib.blake2b(digest_size=32)
                 with open(temp_path, 'wb') as f:
-                    content = await upload_file.read()
-                    if not content:
-                        raise ValueError("File is empty")
-                    f.write(content)
+                    def write(chunk: bytes):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        
+                    while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise too_large
+                        await asyncio.to_thread(write, chunk)
+                if size == 0:
+                    raise ValueError("File is empty")
                 
-                # Extract text based on file type
-                text, error = extract_text_from_file(str(temp_path))
-                if error or not text.strip():
-                    error_msg = error or "No text content found in file"
-                    logger.error(f"Error extracting text from {upload_file.filename}: {error_msg}")
-                    raise ValueError(f"Could not extract text from file: {error_msg}")
+                content_hash = hasher.hexdigest()
                 
-                logger.info(f"Extracted {len(text)} characters from {upload_file.filename}")
-            
-            # Generate a unique ID for this document
-            doc_id = str(uuid.uuid4())
-            
-            # Chunk the text
-            chunks = chunk_text(text, chunk_size=1000, overlap=200)
-            if not chunks:
-                raise ValueError("No text content found in file")
+                # A concurrent upload of the same content waits for that ingestion
+                pending = self._in_flight.get(content_hash)
+                if pending is not None:
+                    logger.info(f"{upload_file.filename} is already being ingested, waiting for it")
+                    return await asyncio.shield(pending)
+                    
+                future = asyncio.get_running_loop().create_future()
+                # Don't warn about failures nobody else was waiting for
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._in_flight[content_hash] = future
+                try:
+                    doc_id = await self._ingest_content(content_hash, temp_path, upload_file.filename)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except BaseException as e:
+                    future.set_exception(e)
+                    raise
+                else:
+                    future.set_result(doc_id)
+                    return doc_id
+                finally:
+                    del self._in_flight[content_hash]
             
-            # Prepare documents for embedding
-            docs = []
-            for i, chunk in enumerate(chunks):
-                docs.append({
-                    'id': f"{doc_id}_{i}",
-                    'text': chunk,
-                    'metadata': {
-                        'source': upload_file.filename,
-                        'chunk_index': i,
-                        'doc_id': doc_id,
-                        'text': chunk  # Store the text in metadata for retrieval
-                    }
-                })
-            
-            logger.info(f"Generated {len(chunks)} chunks from {upload_file.filename}")
-            
-            # Get embeddings for all chunks
-            texts = [doc['text'] for doc in docs]
-            logger.info(f"Generating embeddings for {len(texts)} chunks...")
-            embeddings = await self.embedding_provider.embed_texts(texts)
-            
-            # Add to vector store
-            ids = [doc['id'] for doc in docs]
-            texts = [doc['text'] for doc in docs]
-            metadatas = [doc['metadata'] for doc in docs]
-            
-            logger.info(f"Adding {len(ids)} vectors to the vector store...")
-            # Pass both the text and metadata to ensure proper storage
-            self.vector_store.add_vectors(ids, embeddings, metadatas, texts=texts)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error ingesting file {upload_file.filename}: {str(e)}", exc_info=True)
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error processing file: {str(e)}"
+            )
+
+    async def _ingest_content(self, content_hash: str, path: Path, filename: str) -> str:
+        """Ingest a saved upload, reusing a previous ingestion of the same content.
+        
+        Args:
+            content_hash: Hash of the uploaded bytes
+            path: Path the upload was saved to
+            filename: Name of the uploaded file
             
-            # Verify the vectors were added
-            if hasattr(self.vector_store, 'index'):
-                logger.info(f"Vector store now contains {self.vector_store.index.ntotal} vectors")
+        Returns:
+            str: Document ID of the ingested file
+        """
+        cached_doc_id = await self._ingest_cached(content_hash, filename)
+        if cached_doc_id is not None:
+            return cached_doc_id
+        
+        # Extract text based on file type (off the event loop, parsing is blocking)
+        text, error = await asyncio.to_thread(extract_text_from_file, str(path))
+        if error or not text.strip():
+            error_msg = error or "No text content found in file"
+            logger.error(f"Error extracting text from {filename}: {error_msg}")
+            raise ValueError(f"Could not extract text from file: {error_msg}")
+        
+        logger.info(f"Extracted {len(text)} characters from {filename}")
+        
+        # Generate a unique ID for this document
+        doc_id = str(uuid.uuid4())
+        
+        # Chunk the text
+        chunks = chunk_text(text, chunk_size=1000, overlap=200)
+        if not chunks:
+            raise ValueError("No text content found in file")
+        
+        logger.info(f"Generated {len(chunks)} chunks from {filename}")
+        
+        ids, embeddings, metadatas, texts = await self._embed_chunks(
+            chunks, doc_id, filename
+        )
+        
+        logger.info(f"Adding {len(ids)} vectors to the vector store...")
+        # Pass both the text and metadata to ensure proper storage
+        self.vector_store.add_vectors(ids, embeddings, metadatas, texts=texts, flush=False)
+        await self._schedule_flush(len(ids))
+        
+        await self._save_to_cache(content_hash, doc_id, ids, embeddings, metadatas, texts)
+        
+        # Verify the vectors were added
+        if hasattr(self.vector_store, 'index'):
+            logger.info(f"Vector store now contains {self.vector_store.index.ntotal} vectors")
+        
+        logger.info(f"Successfully ingested document {filename} with {len(chunks)} chunks")
+        
+        return doc_id
+
+    async def _ingest_cached(self, content_hash: str, filename: str) -> Optional[str]:
+        """Reuse a previous ingestion of the same file content.
+        
+        Args:
+            content_hash: Hash of the uploaded bytes
+            filename: Name of the uploaded file (for logging)
             
-            logger.info(f"Successfully ingested document {upload_file.filename} with {len(chunks)} chunks")
+        Returns:
+            The existing document ID, or None if the file has to be ingested
+        """
+        doc_id = await asyncio.to_thread(self.hash_repository.get_doc_id, content_hash)
+        if doc_id is None:
+            return None
             
+        if self.vector_store.has_id(f"{doc_id}_0"):
+            logger.info(f"{filename} is already ingested as document {doc_id}")
             return doc_id
             
+        cached = await asyncio.to_thread(self._load_cache_entry, content_hash)
+        if cached is None:
+            return None
+            
+        ids, embeddings, metadatas, texts = cached
+        logger.info(f"Restoring {len(ids)} cached chunks of {filename} (document {doc_id})")
+        self.vector_store.add_vectors(ids, embeddings, metadatas, texts=texts, flush=False)
+        await self._schedule_flush(len(ids))
+        return doc_id
+
+    async def _save_to_cache(self, content_hash: str, doc_id: str, ids: List[str],
+                             embeddings: np.ndarray, metadatas: List[Dict[str, Any]], texts: List[str]):
+        """Store the chunks and embeddings of a file so identical uploads can skip ingestion."""
+        try:
+            await asyncio.to_thread(self._write_cache_entry, content_hash, ids, embeddings, metadatas, texts)
+            await asyncio.to_thread(self.hash_repository.add, content_hash, doc_id)
         except Exception as e:
-            logger.error(f"Error ingesting file {upload_file.filename}: {str(e)}", exc_info=True)
-            from fastapi import HTTPException
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing file: {str(e)}"
+            # The cache is an optimization, ingestion already succeeded
+            logger.warning(f"Could not cache document {doc_id}: {str(e)}")
+
+    def _write_cache_entry(self, content_hash: str, ids: List[str], embeddings: np.ndarray,
+                           metadatas: List[Dict[str, Any]], texts: List[str]):
+        path = self.cache_dir / f"{content_hash}.npz"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                ids=np.array(ids),
+                vectors=embeddings,
+                # UTF-8 bytes; a numpy str array would store 4 bytes per character
+                metadatas_json=np.frombuffer(orjson.dumps(metadatas, option=orjson.OPT_SERIALIZE_NUMPY), dtype=np.uint8),
+                texts_json=np.frombuffer(orjson.dumps(texts), dtype=np.uint8)
             )
+        os.replace(tmp_path, path)
+
+    def _load_cache_entry(self, content_hash: str):
+        path = self.cache_dir / f"{content_hash}.npz"
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            return (
+                data['ids'].tolist(),
+                data['vectors'],
+                self._load_json_array(data['metadatas_json']),
+                self._load_json_array(data['texts_json'])
+            )
+
+    @staticmethod
+    def _load_json_array(array: np.ndarray):
+        # Entries written before the switch to orjson hold a numpy str scalar
+        return orjson.loads(array.tobytes() if array.dtype == np.uint8 else str(array))
+
+    async def flush(self):
+        """Write pending vector store changes to disk now (e.g. on shutdown)."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._unflushed = 0
+        await asyncio.to_thread(self.vector_store.flush)
+
+    async def _schedule_flush(self, added: int):
+        """Persist the vector store once enough vectors are pending, otherwise after a delay.
+        
+        Batches the full-index rewrites of many uploads into one write.
+        """
+        self._unflushed += added
+        if self._unflushed >= settings.vector_store_flush_every:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._debounced_flush())
+
+    async def _debounced_flush(self):
+        await asyncio.sleep(settings.vector_store_flush_interval)
+        self._flush_task = None
+        self._unflushed = 0
+        await asyncio.to_thread(self.vector_store.flush)
+
+    async def _embed_chunks(self, chunks: List[str], doc_id: str, source: str):
+        """Embed chunks batch by batch while the next batch is being prepared.
+        
+        A producer task builds the chunk records and feeds them through a bounded
+        queue; the consumer embeds each batch as soon as it arrives. Results are
+        accumulated so the vector store is written once per file.
+        
+        Args:
+            chunks: Text chunks of the document
+            doc_id: ID of the document the chunks belong to
+            source: Original filename, stored in the chunk metadata
+            
+        Returns:
+            Tuple of (ids, embeddings, metadatas, texts)
+        """
+        batch_size = settings.embedding_batch_size
+        queue: asyncio.Queue = asyncio.Queue(maxsize=4)
+        
+        async def produce():
+            for start in range(0, len(chunks), batch_size):
+                batch = [
+                    (f"{doc_id}_{i}", chunk, {
+                        'source': source,
+                        'chunk_index': i,
+                        'doc_id': doc_id,
+                        'text': chunk  # Store the text in metadata for retrieval
+                    })
+                    for i, chunk in enumerate(chunks[start:start + batch_size], start)
+                ]
+                await queue.put(batch)
+            await queue.put(None)
+        
+        producer = asyncio.create_task(produce())
+        ids: List[str] = []
+        texts: List[str] = []
+        metadatas: List[Dict[str, Any]] = []
+        vectors: List[np.ndarray] = []
+        try:
+            while (batch := await queue.get()) is not None:
+                batch_texts = [text for _, text, _ in batch]
+                logger.info(f"Generating embeddings for {len(batch_texts)} chunks...")
+                vectors.append(await self.embedding_provider.embed_texts(batch_texts))
+                ids.extend(chunk_id for chunk_id, _, _ in batch)
+                texts.extend(batch_texts)
+                metadatas.extend(metadata for _, _, metadata in batch)
+            await producer
+        finally:
+            producer.cancel()
+        
+        return ids, np.vstack(vectors), metadatas, texts
@@ -1,25 +1,36 @@
 from typing import Optional, List, Dict, Any
+import copy
+import hashlib
+import httpx
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
 import logging
 
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
 class HuggingFaceLLM:
-    """A simple wrapper for Hugging Face language models."""
-    
-    def __init__(self, model_name: str = "gpt2", device: Optional[str] = None):
+    """A simple wrapper for Hugging Face language models, run in-process."""
+
+    def __init__(self, model_name: str = "gpt2", device: Optional[str] = None,
+                 compile_model: Optional[bool] = None):
         """Initialize the Hugging Face language model.
         
         Args:
             model_name: Name of the Hugging Face model to use
             device: Device to run the model on (e.g., 'cuda', 'cpu')
+            compile_model: Wrap the forward pass with torch.compile (defaults to settings.llm_compile)
         """
         self.model_name = model_name
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.compile_model = settings.llm_compile if compile_model is None else compile_model
         self.model = None
         self.tokenizer = None
-        
+        # KV caches of static prompt prefixes, keyed on a hash of the prefix text
+        self._prefix_cache: Dict[bytes, DynamicCache] = {}
+        self._prefix_ids: Dict[bytes, torch.Tensor] = {}
+
     def load(self):
         """Load the model and tokenizer."""
         if self.model is None or self.tokenizer is None:
@@ -30,18 +41,25 @@ class HuggingFaceLLM:
                 torch_dtype=torch.float16 if 'cuda' in self.device else torch.float32,
                 device_map="auto" if 'cuda' in self.device else None
             ).to(self.device)
+            self.model.eval()
+            
+            if self.compile_model:
+                # generate() calls forward() once per token, so compile that
+                self.model.forward = torch.compile(self.model.forward, mode="reduce-overhead", fullgraph=False)
             
             # Set pad token if not set
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
-    
-    async def generate(self, prompt: str, **kwargs) -> str:
+
+    async def generate(self, prompt: str, prefix: Optional[str] = None, **kwargs) -> str:
         """Generate text from the model.
         
         Args:
             prompt: The input prompt
-            **kwargs: Additional generation parameters
-            
+            prefix: Optional static start of the prompt (e.g. the instructions of a
+                template); its KV cache is computed once and reused across calls
+            **kwargs: Additional generation parameters (override the greedy defaults)
+        
         Returns:
             Generated text
         """
@@ -50,8 +68,21 @@ class HuggingFaceLLM:
             
         try:
             # Encode the input
-            inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True, max_length=1024)
-            input_length = inputs["input_ids"].shape[1]
+            max_length = 1024
+            inputs = self.tokenizer(prompt, return_tensors="pt", padding=True, truncation=True, max_length=max_length)
+            input_ids = inputs["input_ids"]
+            input_length = input_ids.shape[1]
+            
+            # Reuse the prefix's KV cache only if the prompt tokenizes to the prefix's
+            # tokens followed by more, so the model sees exactly the uncached tokens
+            past_key_values = None
+            if prefix and prompt.startswith(prefix):
+                prefix_ids, cache = self._get_prefix_cache(prefix)
+                n = prefix_ids.shape[1]
+                if input_length > n and torch.equal(input_ids[:, :n], prefix_ids):
+                    past_key_values = cache
+                else:
+                    logger.debug("Prompt does not start with the prefix tokens, not using the prefix cache")
             
             # Set max_new_tokens to a reasonable value (e.g., 200) or based on model's max length
             max_new_tokens = min(
@@ -62,17 +93,26 @@ class HuggingFaceLLM:
             if max_new_tokens <= 0:
                 return "[Error: Input is too long. Please try a shorter query or split your input into smaller chunks.]"
             
+            # Greedy decoding by default: deterministic answers play well with answer caching
+            generation_kwargs = {
+                "max_new_tokens": max_new_tokens,
+                "num_return_sequences": 1,
+                "do_sample": False,
+                "pad_token_id": self.tokenizer.eos_token_id,
+                "eos_token_id": self.tokenizer.eos_token_id,
+                **kwargs
+            }
+            if past_key_values is not None:
+                # generate() extends the cache in place, so hand it a copy
+                generation_kwargs["past_key_values"] = copy.deepcopy(past_key_values)
+            
             # Generate the output
-            outputs = self.model.generate(
-                input_ids=inputs["input_ids"].to(self.device),
-                attention_mask=inputs["attention_mask"].to(self.device),
-                max_new_tokens=max_new_tokens,
-                num_return_sequences=1,
-                temperature=0.7,
-                do_sample=True,
-                pad_token_id=self.tokenizer.eos_token_id,
-                eos_token_id=self.tokenizer.eos_token_id,
-            )
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    input_ids=input_ids.to(self.device),
+                    attention_mask=torch.ones_like(input_ids).to(self.device),
+                    **generation_kwargs
+                )
             
             # Decode the output
             generated = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
@@ -87,5 +127,94 @@ class HuggingFaceLLM:
             logger.error(f"Error generating text: {str(e)}", exc_info=True)
             return f"Error generating response: {str(e)}"
 
+    def warmup(self, prefix: Optional[str] = None):
+        """Load the model and precompute the token ids and KV cache of a static prefix.
+        
+        Args:
+            prefix: Static start of the prompts that will be passed to generate()
+        """
+        self.load()
+        if prefix:
+            self._get_prefix_cache(prefix)
+
+    def _get_prefix_cache(self, prefix: str):
+        """Return the token ids and KV cache of a prompt prefix, computing them once."""
+        key = hashlib.blake2b(prefix.encode("utf-8"), digest_size=8).digest()
+        if key not in self._prefix_cache:
+            prefix_ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"]
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(input_ids=prefix_ids.to(self.device), past_key_values=cache, use_cache=True)
+            self._prefix_ids[key] = prefix_ids
+            self._prefix_cache[key] = cache
+        return self._prefix_ids[key], self._prefix_cache[key]
+
+class RemoteLLM:
+    """Client for an OpenAI-compatible completions server (vLLM, TGI).
+    
+    The server batches concurrent requests (continuous batching, paged KV cache),
+    so many /ask calls share one forward pass instead of queueing on the process.
+    """
+    
+    def __init__(self, url: str, model_name: str = "gpt2", timeout: float = 60.0,
+                 client: Optional[httpx.AsyncClient] = None):
+        """Initialize the remote LLM client.
+        
+        Args:
+            url: Base URL of the server (e.g. http://localhost:8001)
+            model_name: Name of the model served
+            timeout: Request timeout in seconds
+            client: Optional preconfigured HTTP client
+        """
+        self.url = url.rstrip("/")
+        self.model_name = model_name
+        self.timeout = timeout
+        self._client = client
+        
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Lazily create one pooled HTTP client for all requests."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.url, timeout=self.timeout)
+        return self._client
+    
+    async def generate(self, prompt: str, prefix: Optional[str] = None, **kwargs) -> str:
+        """Generate text through the completions endpoint.
+        
+        Args:
+            prompt: The input prompt
+            prefix: Ignored; the server caches shared prefixes itself
+            **kwargs: Additional completion parameters (override the greedy defaults)
+            
+        Returns:
+            Generated text
+        """
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "max_tokens": 200,
+            "temperature": 0,
+            **kwargs
+        }
+        try:
+            response = await self.client.post("/v1/completions", json=payload)
+            response.raise_for_status()
+            return response.json()["choices"][0]["text"].strip()
+        except Exception as e:
+            logger.error(f"Error generating text: {str(e)}", exc_info=True)
+            return f"Error generating response: {str(e)}"
+    
+    async def aclose(self):
+        """Close the underlying HTTP client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+def create_llm():
+    """Create the LLM client selected by settings.llm_backend."""
+    if settings.llm_backend == "vllm":
+        return RemoteLLM(settings.llm_url, model_name=settings.llm_model_name)
+    return HuggingFaceLLM(model_name=settings.llm_model_name)
+
 # Create a default instance
-default_llm = HuggingFaceLLM()
+default_llm = create_llm()
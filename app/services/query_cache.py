@@ -0,0 +1,96 @@
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Sources = List[Dict[str, Union[str, int, float]]]
+
+
+class SemanticAnswerCache:
+    """
+    Approximate answer cache keyed on normalized query embeddings.
+
+    A lookup is a hit when the cosine similarity between the query embedding and a
+    cached key is at least ``threshold`` and the entry is younger than ``ttl``.
+    Keys live in a single float32 matrix so a lookup is one matrix-vector product.
+    """
+
+    def __init__(self, threshold: float = 0.97, ttl: float = 600.0, max_size: int = 2000):
+        """
+        Args:
+            threshold: minimum cosine similarity for a cached entry to be reused
+            ttl: time-to-live of an entry in seconds
+            max_size: maximum number of cached entries (least recently used is evicted)
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._keys: Optional[np.ndarray] = None  # (max_size, dim) float32
+        self._created = np.zeros(max_size, dtype=np.float64)
+        self._last_used = np.zeros(max_size, dtype=np.float64)
+        self._top_k = np.zeros(max_size, dtype=np.int64)
+        self._values: List[Optional[Tuple[str, Sources]]] = [None] * max_size
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def lookup(self, embedding: Any, top_k: int) -> Optional[Tuple[str, Sources]]:
+        """Return the cached ``(answer, sources)`` for a similar query, if any."""
+        q = self._normalize(embedding)
+        with self._lock:
+            if self._size == 0 or self._keys is None or q.shape[0] != self._keys.shape[1]:
+                return None
+
+            n = self._size
+            now = time.monotonic()
+            scores = self._keys[:n] @ q
+            # Entries retrieved with a different top_k or past their TTL never match
+            scores[self._top_k[:n] != top_k] = -np.inf
+            scores[now - self._created[:n] >= self.ttl] = -np.inf
+
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return None
+
+            self._last_used[slot] = now
+            logger.debug(f"Answer cache hit (similarity={scores[slot]:.4f})")
+            return self._values[slot]
+
+    def store(self, embedding: Any, top_k: int, answer: str, sources: Sources) -> None:
+        """Cache an answer under the given query embedding."""
+        q = self._normalize(embedding)
+        with self._lock:
+            if self._keys is None or q.shape[0] != self._keys.shape[1]:
+                self._keys = np.zeros((self.max_size, q.shape[0]), dtype=np.float32)
+                self._size = 0
+
+            if self._size < self.max_size:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+
+            now = time.monotonic()
+            self._keys[slot] = q
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._top_k[slot] = top_k
+            self._values[slot] = (answer, sources)
+
+    def clear(self) -> None:
+        """Drop all cached entries (e.g. after new documents are ingested)."""
+        with self._lock:
+            self._values = [None] * self.max_size
+            self._size = 0
+
+    @staticmethod
+    def _normalize(embedding: Any) -> np.ndarray:
+        q = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
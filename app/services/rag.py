@@ -1,21 +1,53 @@
-from lib2to3.fixes.fix_input import context
 from typing import Tuple, List, Optional, Any, Dict, Union
+from collections import OrderedDict
 import asyncio
+import hashlib
 import logging
+import re
 from pathlib import Path
-from app.services.embeddings import HFEmbeddingProvider
+import numpy as np
+from app.services.embeddings import HFEmbeddingProvider, AsyncEmbeddingBatcher
+from app.services.embed_cache import QueryEmbeddingCache
 from app.services.vector_store import FaissVectorStore
 from app.services.llm import default_llm
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Static instructions every answer prompt starts with; the LLM caches their KV state.
+# It ends on text, not whitespace, so tokenizers that merge whitespace runs split the
+# prompt at the same place with or without the cached prefix
+PROMPT_PREFIX = (
+    "Answer the question using ONLY the information from the provided context. \n"
+    "        If the answer cannot be found in the context, respond with \"I don't know\"."
+)
+# Static pieces placed before and after the contexts
+PROMPT_CONTEXTS = "\n        \n        "
+PROMPT_QUESTION = "\n        \n        Question: "
+PROMPT_SUFFIX = "\n        \n        Answer (use only the context above):"
+
+# Words ignored when checking that an answer is grounded in its contexts
+COMMON_WORDS = frozenset({"the", "a", "an", "and", "or", "but", "is", "are", "was", "were", "in", "on", "at", "to", "for"})
+_WORD_RE = re.compile(r"\w{3,}")
+# Answers that are refusals rather than content
+REFUSAL_ANSWERS = frozenset({"i don't know", "i don't know.", "", "i don't have enough information"})
+GENERIC_INDICATORS = (
+    "as an ai", "i'm sorry", "i apologize", "i cannot", "i don't have",
+    "i don't know", "i do not know", "i'm not sure", "i am not sure"
+)
+_GENERIC_INDICATOR_RE = re.compile("|".join(map(re.escape, GENERIC_INDICATORS)))
+
+def _escape_braces(text: str) -> str:
+    """Escape literal text for use in a str.format template."""
+    return text.replace("{", "{{").replace("}", "}}")
+
 class RAGService:
     def __init__(self, 
                  emb_provider: Optional[HFEmbeddingProvider] = None, 
                  vector_store: Optional[FaissVectorStore] = None, 
                  llm_client: Any = default_llm,
-                 vector_store_path: Optional[Path] = None):
+                 vector_store_path: Optional[Path] = None,
+                 embedding_cache: Optional[QueryEmbeddingCache] = None):
         """Initialize the RAG service.
         
         Args:
@@ -23,11 +55,16 @@ class RAGService:
             vector_store: Optional pre-initialized vector store
             llm_client: The LLM client to use for generating answers
             vector_store_path: Path to the vector store directory
+            embedding_cache: On-disk query embedding cache (defaults to QueryEmbeddingCache())
         """
-        from app.services.embeddings import HFEmbeddingProvider
-        
         # Initialize embedding provider
         self.embedding_provider = emb_provider or HFEmbeddingProvider()
+        # Concurrent queries are coalesced into one embedding batch
+        self._embed_batcher = AsyncEmbeddingBatcher(
+            self.embedding_provider,
+            max_wait=settings.query_batch_wait_ms / 1000,
+            max_tokens=settings.query_batch_max_tokens
+        )
         
         # Initialize vector store
         if vector_store is not None:
@@ -36,36 +73,94 @@ class RAGService:
             # Use provided path or default to data/vector_store
             vs_path = Path(vector_store_path) if vector_store_path else Path("data/vector_store")
             vs_path.mkdir(parents=True, exist_ok=True)
-            self.vs = FaissVectorStore(dim=384, persist_path=str(vs_path))  # all-MiniLM-L6-v2 uses 384 dim
+            self.vs = FaissVectorStore(  # all-MiniLM-L6-v2 uses 384 dim
+                dim=384,
+                persist_path=str(vs_path),
+                index_type=settings.vector_index_type,
+                train_size=settings.vector_index_train_size,
+                ef_search=settings.hnsw_ef_search,
+                nprobe=settings.ivf_nprobe
+            )
             
         self.llm = llm_client
+        
+        # Exact-match LRU of query embeddings, keyed on a hash of the normalized query
+        self._query_embeddings: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._query_embeddings_max_size = settings.query_embedding_cache_size
+        # Persistent cache behind it, shared across restarts and workers
+        self.embedding_cache = embedding_cache or QueryEmbeddingCache()
+        # Prompt format strings, keyed on the number of contexts they hold
+        self._prompt_templates: Dict[int, str] = {}
         logger.info("RAG service initialized with HuggingFace LLM and embedding provider")
 
-    async def answer_query(self, query: str, top_k: int = 5, min_score: float = 0.3) -> Tuple[str, List[Dict[str, Union[str, int, float]]]]:
+    def warmup(self):
+        """Load the LLM and tokenize the static prompt prefix ahead of the first query.
+        
+        Each request then only tokenizes its context chunks and question. Clients
+        without a local tokenizer (e.g. RemoteLLM) have no warmup and are skipped.
+        """
+        warmup = getattr(self.llm, "warmup", None)
+        if callable(warmup):
+            warmup(PROMPT_PREFIX)
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query string.
+        
+        Args:
+            query: The user's question
+            
+        Returns:
+            The query embedding vector (read-only, it may be shared through the cache)
+        """
+        key = self._query_key(query)
+        embedding = self._query_embeddings.get(key)
+        if embedding is not None:
+            self._query_embeddings.move_to_end(key)
+            return embedding
+            
+        # The on-disk cache is keyed on the exact text that gets embedded
+        model_id = self.embedding_provider.model_id
+        embedding = await asyncio.to_thread(self.embedding_cache.get, query, model_id)
+        if embedding is None:
+            embedding = await self._embed_batcher.submit(query)
+            try:
+                await asyncio.to_thread(self.embedding_cache.put, query, model_id, embedding)
+            except OSError as e:
+                # The cache is an optimization, the embedding is still usable
+                logger.warning(f"Could not cache query embedding: {str(e)}")
+        embedding.setflags(write=False)
+        self._query_embeddings[key] = embedding
+        if len(self._query_embeddings) > self._query_embeddings_max_size:
+            self._query_embeddings.popitem(last=False)
+        return embedding
+
+    @staticmethod
+    def _query_key(query: str) -> bytes:
+        """BLAKE2b-64 digest of the query with whitespace normalized."""
+        return hashlib.blake2b(" ".join(query.split()).encode("utf-8"), digest_size=8).digest()
+
+    async def answer_query(self, query: str, top_k: int = 5, min_score: float = 0.3,
+                           query_embedding: Optional[np.ndarray] = None) -> Tuple[str, List[Dict[str, Union[str, int, float]]]]:
         """Answer a query using the RAG pipeline.
         
         Args:
-{{ ... }}
+            query: The user's question
             top_k: Number of relevant contexts to retrieve
             min_score: Minimum similarity score for a context to be considered relevant
+            query_embedding: Optional precomputed embedding of the query (from embed_query)
             
         Returns:
             A tuple of (answer, list of source documents)
         """
         MAX_CONTEXT_CHARS = 4000  # Reduced from 8000 to be safer
         try:
-            # Get the query embedding (using embed_texts with a single query)
-            query_embedding = (await self.embedding_provider.embed_texts([query]))[0]
+            # Get the query embedding unless the caller already computed it
+            if query_embedding is None:
+                query_embedding = await self.embed_query(query)
             
-            # Retrieve relevant chunks (get more than needed to have options)
-            relevant_hits = self.vs.query(query_embedding, top_k=top_k * 2)
-            
-            # Filter by minimum score and sort by score (highest first)
-            relevant_hits = sorted(
-                [h for h in relevant_hits if h[1] >= min_score],
-                key=lambda x: x[1], 
-                reverse=True
-            )
+            # Retrieve relevant chunks (get more than needed to have options),
+            # best first and already filtered by minimum score
+            relevant_hits = self.vs.query(query_embedding, top_k=top_k * 2, min_score=min_score)
             
             if not relevant_hits:
                 return "I couldn't find any relevant information to answer your question.", []
@@ -98,11 +193,11 @@ class RAGService:
             logger.info(f"Using {len(contexts)} context chunks with {total_chars} characters")
             
             # Build the prompt with the selected contexts
-            prompt = self._build_prompt(query, contexts)
+            # _format_hit only returns non-empty text, so skip re-validating the contexts
+            prompt = self._build_prompt(query, contexts, validated=True)
             
             # Generate the answer using the LLM with instructions to only use the context
-            answer = await self.llm.generate(prompt)
-            print("answer", answer)
+            answer = await self.llm.generate(prompt, prefix=PROMPT_PREFIX)
             
             # Verify the answer is grounded in the context
             if not self._is_answer_grounded(answer, contexts):
@@ -112,9 +207,9 @@ class RAGService:
             used_indices = [i for i, _ in enumerate(contexts)]
             sources = [
                 {
-                    'source': relevant_hits[i][2].get('source', 'Unknown source'),
+                    'source': self.vs.get_source(relevant_hits[i][2]),
                     'score': float(relevant_hits[i][1]),
-                    'chunk_index': relevant_hits[i][2].get('chunk_index', -1)
+                    'chunk_index': self.vs.get_chunk_index(relevant_hits[i][2])
                 }
                 for i in used_indices if i < len(relevant_hits)
             ]
@@ -129,50 +224,31 @@ class RAGService:
         """Extract text from a hit tuple.
         
         Args:
-            hit: A tuple of (id, score, metadata)
+            hit: A tuple of (id, score, idx)
             
         Returns:
-            The text content from the hit's metadata or id_map
+            The text content stored for the hit in the vector store
         """
-        if not hit or len(hit) < 2:
+        if not hit or len(hit) < 3:
             logger.warning(f"Invalid hit format: {hit}")
             return ""
             
-        # Get the document ID from the hit
-        doc_id = hit[0]
-        logger.debug(f"Processing hit with ID: {doc_id}")
-        
-        # First try to get text from the vector store's id_map
-        if hasattr(self.vs, 'id_map') and self.vs.id_map:
-            logger.debug(f"id_map type: {type(self.vs.id_map)}")
-            logger.debug(f"id_map first few items: {list(self.vs.id_map.items())[:2] if hasattr(self.vs.id_map, 'items') else self.vs.id_map[:2]}")
-            
-            # Handle both dict and list formats for id_map
-            if hasattr(self.vs.id_map, 'items'):  # If it's a dict
-                if doc_id in self.vs.id_map:
-                    return str(self.vs.id_map[doc_id])
-            else:  # If it's a list
-                for item in self.vs.id_map:
-                    if isinstance(item, (list, tuple)) and len(item) >= 2 and item[0] == doc_id:
-                        return str(item[1])
-            
-        # If not found in id_map, try to get from metadata
-        if len(hit) >= 3:
-            metadata = hit[2]
-            logger.debug(f"Hit metadata: {metadata}")
-            if isinstance(metadata, dict):
-                print("metadata", metadata)
-                text = metadata.get('text', '')
-                if text:
-                    return str(text)
-        
-        logger.warning(f"Could not find text content for hit: {hit}")
-        return ""
+        # The hit carries its index position, so the text is a direct lookup
+        text = self.vs.get_text(hit[2])
+        if not text:
+            logger.warning(f"Could not find text content for hit: {hit}")
+        return str(text)
 
-    def _build_prompt(self, query: str, contexts: List[str]) -> str:
-        """Build a prompt that instructs the model to only use the provided context."""
+    def _build_prompt(self, query: str, contexts: List[str], validated: bool = False) -> str:
+        """Build a prompt that instructs the model to only use the provided context.
+        
+        Args:
+            query: The user's question
+            contexts: Context chunks to include
+            validated: The caller guarantees every context is non-blank
+        """
         # Filter out empty contexts
-        valid_contexts = [ctx for ctx in contexts if ctx.strip()]
+        valid_contexts = contexts if validated else [ctx for ctx in contexts if ctx.strip()]
         
         if not valid_contexts:
             logger.warning("No valid contexts provided for prompt building")
@@ -182,42 +258,44 @@ class RAGService:
             
             Answer: I don't know."""
             
-        context_block = "\n\n".join(f"Context {i+1}: {ctx}" for i, ctx in enumerate(valid_contexts))
-        
-        return f"""Answer the question using ONLY the information from the provided context. 
-        If the answer cannot be found in the context, respond with "I don't know".
-        
-        {context_block}
-        
-        Question: {query}
-        
-        Answer (use only the context above):"""
+        # Only the contexts and the query are filled in; str.format leaves braces in them alone
+        return self._prompt_template(len(valid_contexts)).format(*valid_contexts, query)
+
+    def _prompt_template(self, n_contexts: int) -> str:
+        """Format string of the prompt for n_contexts contexts, built once per count."""
+        template = self._prompt_templates.get(n_contexts)
+        if template is None:
+            context_block = "\n\n".join(f"Context {i + 1}: {{}}" for i in range(n_contexts))
+            template = "".join([
+                _escape_braces(PROMPT_PREFIX), _escape_braces(PROMPT_CONTEXTS), context_block,
+                _escape_braces(PROMPT_QUESTION), "{}", _escape_braces(PROMPT_SUFFIX)
+            ])
+            self._prompt_templates[n_contexts] = template
+        return template
 
     def _is_answer_grounded(self, answer: str, contexts: List[str]) -> bool:
         """Check if the answer is grounded in the provided contexts."""
-        # Check for empty or generic responses
-        if not answer or answer.lower() in ["i don't know", "i don't know.", "", "i don't have enough information"]:
+        # Check for empty or generic responses first; both are cheap and spare the
+        # tokenization of the contexts below
+        answer = answer.lower() if answer else ""
+        if answer in REFUSAL_ANSWERS:
             return False
             
-        # Check if the answer is too generic
-        generic_indicators = [
-            "as an ai", "i'm sorry", "i apologize", "i cannot", "i don't have", 
-            "i don't know", "i do not know", "i'm not sure", "i am not sure"
-        ]
-        
-        if any(indicator in answer.lower() for indicator in generic_indicators):
+        # Check if the answer is too generic (one scan for all indicators)
+        if _GENERIC_INDICATOR_RE.search(answer):
             return False
             
         # Check if any part of the answer appears in the contexts
         # Simple check: see if any non-common words from the answer are in the contexts
-        common_words = {"the", "a", "an", "and", "or", "but", "is", "are", "was", "were", "in", "on", "at", "to", "for"}
-        answer_words = set(word.lower() for word in answer.split() if word.lower() not in common_words and len(word) > 2)
+        answer_words = set(_WORD_RE.findall(answer)) - COMMON_WORDS
         
         if not answer_words:
             return False
             
-        context_text = " ".join(contexts).lower()
-        matching_words = sum(1 for word in answer_words if word in context_text)
+        context_vocab = set()
+        for context in contexts:
+            context_vocab.update(_WORD_RE.findall(context.lower()))
+        matching_words = len(answer_words & context_vocab)
         
         # If at least 50% of the non-common words in the answer are in the context, consider it grounded
         return (matching_words / len(answer_words)) >= 0.5
@@ -4,50 +4,122 @@ import os
 import json
 import pickle
 import logging
-from typing import List, Tuple, Optional
+import orjson
+import threading
+from typing import Dict, List, Tuple, Optional
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# FAISS index_factory descriptions for the supported index types.
+# Types not in DIRECT_INDEX_TYPES start as an exact flat index and are built
+# once train_size vectors exist.
+INDEX_TYPES = {
+    "flat": "Flat",
+    "fp16": "SQfp16",  # half-precision storage, 2x smaller than float32, near-exact
+    "sq8": "SQ8",  # 8-bit scalar quantization, 4x smaller than float32
+    "hnsw": "HNSW32",  # graph-based ANN, O(log N) search, no training needed
+    "ivfpq": "IVF256,PQ32x8",  # inverted lists + product quantization, 32 bytes per vector
+}
+
+# Fewest vectors each trainable index type can be trained on (IVF256 needs a point
+# per list and PQ x8 one per centroid; FAISS recommends ~39x that)
+MIN_TRAIN_SIZES = {"ivfpq": 256}
+
+# Index types that need no training and are used from the first vector
+DIRECT_INDEX_TYPES = {"flat", "fp16", "hnsw"}
+
+# HNSW build breadth (higher = better graph, slower inserts)
+HNSW_EF_CONSTRUCTION = 200
+
 class VectorStore:
-    def add_vectors(self, ids: List[str], vectors: List[List[float]], metadata: List[dict]):
+    def add_vectors(self, ids: List[str], vectors: np.ndarray, metadata: List[dict]):
+        raise NotImplementedError
+
+    def query(self, vector: np.ndarray, top_k: int,
+              min_score: Optional[float] = None) -> List[Tuple[str, float, int]]:
+        raise NotImplementedError
+
+    def get_source(self, idx: int) -> str:
+        raise NotImplementedError
+
+    def get_chunk_index(self, idx: int) -> int:
+        raise NotImplementedError
+
+    def get_text(self, idx: int) -> str:
         raise NotImplementedError
 
-    def query(self, vector: List[float], top_k: int) -> List[Tuple[str, float, dict]]:
+    def has_id(self, id: str) -> bool:
         raise NotImplementedError
 
+    def flush(self):
+        """Persist pending changes (no-op for stores without persistence)."""
+
 class FaissVectorStore(VectorStore):
-    def __init__(self, dim: int, persist_path: str = "./data/vector_store"):
+    def __init__(self, dim: int, persist_path: str = "./data/vector_store",
+                 index_type: str = "flat", train_size: int = 10000, ef_search: int = 64,
+                 nprobe: int = 8):
         """Initialize the FAISS vector store with optional persistence.
         
         Args:
             dim: Dimension of the vectors
             persist_path: Directory to save/load the vector store
+            index_type: One of INDEX_TYPES; non-flat indexes start as an exact flat
+                index and are rebuilt once train_size vectors have been added
+            train_size: Number of vectors required to train a non-flat index
+            ef_search: HNSW search breadth; each search visits roughly this many
+                candidate lists, trading recall for latency
+            nprobe: Number of IVF lists scanned per search (ivfpq only)
         """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index_type}")
+        min_train_size = MIN_TRAIN_SIZES.get(index_type, 1)
+        if train_size < min_train_size:
+            raise ValueError(
+                f"train_size must be at least {min_train_size} for {index_type} indexes, got {train_size}"
+            )
+            
         self.dim = dim
+        self.index_type = index_type
+        self.train_size = train_size
+        self.ef_search = ef_search
+        self.nprobe = nprobe
         self.persist_path = Path(persist_path)
         self.persist_path.mkdir(parents=True, exist_ok=True)
         
         # Initialize empty index and data structures
-        self.index = faiss.IndexFlatIP(dim)
+        self.index = self._new_index()
         self.id_map = []
         self.metadatas = []
         self.texts = []  # Store text content separately
+        # Per-field columns of the metadata, indexed like the FAISS index
+        self._sources: List[str] = []
+        self._chunk_indices = np.empty(0, dtype=np.int32)
+        self._texts: List[str] = []
+        self._id_to_idx: Dict[str, int] = {}  # Chunk ID -> index position
+        self._dirty = False  # True when there are additions not yet written to disk
+        self._persisted = 0  # Entries already appended to meta.jsonl
+        self._log_size = 0  # Bytes of meta.jsonl holding those entries
+        self._consistent = True  # False when the index and metadata on disk disagree
+        self._lock = threading.RLock()
+        self._local = threading.local()  # Per-thread query buffer
         
         # Try to load existing data
         self._load()
 
-    def add_vectors(self, ids, vectors, metadata, texts=None):
-        """Add vectors to the index and save to disk.
+    def add_vectors(self, ids, vectors, metadata, texts=None, flush=True):
+        """Add vectors to the index and optionally save to disk.
         
         Args:
             ids: List of document chunk IDs
-            vectors: List of vector embeddings
+            vectors: Array of vector embeddings with shape (n, dim)
             metadata: List of metadata dictionaries
             texts: Optional list of text contents (will be stored in metadata if not None)
+            flush: Write the store to disk now; pass False to batch writes and call flush() later
         """
-        vs = np.array(vectors).astype('float32')
-        self.index.add(vs)
+        # Copy, then L2-normalize in place so inner product is cosine similarity
+        vs = np.array(vectors, dtype=np.float32, order='C')
+        faiss.normalize_L2(vs)
         
         # Store text in metadata if provided
         if texts is not None:
@@ -55,79 +127,247 @@ class FaissVectorStore(VectorStore):
                 if i < len(metadata):
                     metadata[i]['text'] = text
         
-        self.id_map.extend(ids)
-        self.metadatas.extend(metadata)
-        self._save()
+        with self._lock:
+            if not self._consistent:
+                raise RuntimeError(
+                    f"Vector store at {self.persist_path} has {self.index.ntotal} vectors but "
+                    f"{len(self.id_map)} metadata entries; refusing to add until it is rebuilt"
+                )
+            self.index.add(vs)
+            self.id_map.extend(ids)
+            self.metadatas.extend(metadata)
+            self._append_columns(ids, metadata)
+            self._maybe_build_index()
+            self._dirty = True
+            if flush:
+                self.flush()
+
+    def get_source(self, idx: int) -> str:
+        """Source file name of the vector at index position ``idx``."""
+        return self._sources[idx]
+
+    def get_chunk_index(self, idx: int) -> int:
+        """Chunk number within its source of the vector at ``idx``."""
+        return int(self._chunk_indices[idx])
+
+    def get_text(self, idx: int) -> str:
+        """Text of the chunk stored at ``idx``."""
+        return self._texts[idx]
+
+    def _append_columns(self, ids: List[str], metadatas: List[dict]):
+        """Extend the ID lookup and the per-field metadata columns with new entries."""
+        start = len(self._texts)
+        self._id_to_idx.update(zip(ids, range(start, start + len(ids))))
+        self._sources.extend(m.get('source', 'Unknown source') for m in metadatas)
+        self._chunk_indices = np.concatenate([
+            self._chunk_indices,
+            np.fromiter((m.get('chunk_index', -1) for m in metadatas), dtype=np.int32, count=len(metadatas))
+        ])
+        # Older stores kept texts in a separate list instead of the metadata
+        self._texts.extend(
+            m.get('text') or (self.texts[i] if i < len(self.texts) else "")
+            for i, m in enumerate(metadatas, start)
+        )
+
+    def has_id(self, id: str) -> bool:
+        """Check whether a chunk ID is stored."""
+        return id in self._id_to_idx
+
+    def flush(self):
+        """Write the index and metadata to disk if anything was added since the last write."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def _query_buffer(self) -> np.ndarray:
+        """Return this thread's reusable (1, dim) float32 query array."""
+        buf = getattr(self._local, "query_buf", None)
+        if buf is None or buf.shape[1] != self.dim:
+            buf = self._local.query_buf = np.empty((1, self.dim), dtype=np.float32)
+        return buf
+
+    def _new_index(self):
+        """Create the empty index new vectors go into."""
+        if self.index_type == "flat" or self.index_type not in DIRECT_INDEX_TYPES:
+            return faiss.IndexFlatIP(self.dim)
+        index = faiss.index_factory(self.dim, INDEX_TYPES[self.index_type], faiss.METRIC_INNER_PRODUCT)
+        self._configure_index(index)
+        return index
+
+    def _maybe_build_index(self):
+        """Replace the flat index with the configured index once it can be trained.
+        
+        Flat stores saved before their index type was used directly are migrated
+        on the next add.
+        """
+        if self.index_type == "flat" or not isinstance(self.index, faiss.IndexFlat):
+            return
+        if self.index_type not in DIRECT_INDEX_TYPES and self.index.ntotal < self.train_size:
+            return
+            
+        logger.info(f"Training {self.index_type} index on {self.index.ntotal} vectors")
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        index = faiss.index_factory(self.dim, INDEX_TYPES[self.index_type], faiss.METRIC_INNER_PRODUCT)
+        self._configure_index(index)
+        index.train(vectors)
+        index.add(vectors)
+        self.index = index
+
+    def _configure_index(self, index):
+        """Apply search-time parameters that depend on the index type."""
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = self.ef_search
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = self.nprobe
+            if isinstance(index, faiss.IndexIVFPQ):
+                # Polysemous codes only help Hamming-filtered search, which is unused
+                # here, and training them dominates the build time
+                index.do_polysemous_training = False
         
     def _save(self):
-        """Save the index and metadata to disk."""
+        """Append the metadata added since the last save to disk, then save the index.
+        
+        The metadata goes first so an interrupted save leaves at most extra trailing
+        records, which _load drops, rather than vectors without metadata.
+        """
         try:
-            # Save FAISS index
-            faiss.write_index(self.index, str(self.persist_path / "index.faiss"))
+            # Append new id/metadata/text records, one JSON object per line; rewrite
+            # the log from scratch when nothing of it is known to be on disk
+            meta_path = self.persist_path / "meta.jsonl"
+            mode = "ab" if self._persisted else "wb"
+            try:
+                with open(meta_path, mode) as f:
+                    f.writelines(
+                        orjson.dumps({
+                            "id": self.id_map[i],
+                            "m": {k: v for k, v in self.metadatas[i].items() if k != 'text'},
+                            "t": self._texts[i]
+                        }, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+                        for i in range(self._persisted, len(self.id_map))
+                    )
+                    log_size = f.tell()
+            except Exception:
+                # Drop whatever part of the records made it to disk, so the next
+                # save doesn't append after torn or duplicate bytes
+                if meta_path.exists():
+                    os.truncate(meta_path, self._log_size)
+                raise
+            self._persisted = len(self.id_map)
+            self._log_size = log_size
             
-            # Save id_map, metadatas, and texts
-            with open(self.persist_path / "metadata.pkl", "wb") as f:
-                pickle.dump({
-                    'id_map': self.id_map,
-                    'metadatas': self.metadatas,
-                    'dim': self.dim,
-                    'texts': self.texts if hasattr(self, 'texts') else []
-                }, f)
+            # Save FAISS index (replaced atomically, it is rewritten in full)
+            index_path = self.persist_path / "index.faiss"
+            tmp_path = index_path.with_suffix(".tmp")
+            faiss.write_index(self.index, str(tmp_path))
+            os.replace(tmp_path, index_path)
             logger.info(f"Vector store saved to {self.persist_path}")
         except Exception as e:
             logger.error(f"Error saving vector store: {str(e)}")
             raise
     
     def _load(self):
-        """Load the index and metadata from disk if they exist."""
+        """Load the index and metadata from disk if they exist.
+        
+        Raises:
+            RuntimeError: If the files exist but cannot be read; they are left
+                untouched instead of being overwritten by an empty store
+        """
         index_path = self.persist_path / "index.faiss"
-        meta_path = self.persist_path / "metadata.pkl"
+        meta_path = self.persist_path / "meta.jsonl"
+        legacy_meta_path = self.persist_path / "metadata.pkl"
         
-        if index_path.exists() and meta_path.exists():
+        if index_path.exists() and (meta_path.exists() or legacy_meta_path.exists()):
             try:
                 # Load FAISS index
                 self.index = faiss.read_index(str(index_path))
+                self._configure_index(self.index)
+                self.dim = self.index.d
                 
                 # Load metadata
-                with open(meta_path, "rb") as f:
-                    data = pickle.load(f)
-                    self.id_map = data['id_map']
-                    self.metadatas = data['metadatas']
-                    self.dim = data['dim']
-                    self.texts = data.get('texts', [])
-                
-                logger.info(f"Loaded vector store with {len(self.id_map)} vectors from {self.persist_path}")
+                if meta_path.exists():
+                    self._read_metadata_log(meta_path, self.index.ntotal)
+                    self._persisted = len(self.id_map)
+                else:
+                    # Stores saved before meta.jsonl; the next flush migrates them
+                    with open(legacy_meta_path, "rb") as f:
+                        data = pickle.load(f)
+                        self.id_map = data['id_map']
+                        self.metadatas = data['metadatas']
+                        self.texts = data.get('texts', [])
+                    self._dirty = True
+                self.metadatas = [m if isinstance(m, dict) else {} for m in self.metadatas]
+                self._append_columns(self.id_map, self.metadatas)
             except Exception as e:
                 logger.error(f"Error loading vector store: {str(e)}")
-                # Reset to empty index if loading fails
-                self.index = faiss.IndexFlatIP(self.dim)
-                self.id_map = []
-                self.metadatas = []
-                self.texts = []
+                raise RuntimeError(f"Could not load vector store from {self.persist_path}: {str(e)}") from e
+                
+            if self.index.ntotal != len(self.id_map):
+                # New vectors would be paired with the wrong metadata
+                logger.error(f"Index has {self.index.ntotal} vectors but metadata has {len(self.id_map)} entries; "
+                             f"the store is read-only until it is rebuilt")
+                self._consistent = False
+            logger.info(f"Loaded vector store with {len(self.id_map)} vectors from {self.persist_path}")
+
+    def _read_metadata_log(self, path: Path, max_records: int):
+        """Stream meta.jsonl, dropping a partial last line left by an interrupted save
+        and records past max_records whose vectors never made it into the index."""
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n") or len(self.id_map) == max_records:
+                    break
+                record = orjson.loads(line)
+                metadata = record["m"]
+                metadata['text'] = record["t"]
+                self.id_map.append(record["id"])
+                self.metadatas.append(metadata)
+                valid_bytes += len(line)
+                
+        if valid_bytes < path.stat().st_size:
+            logger.warning(f"Truncating records without vectors at the end of {path}")
+            os.truncate(path, valid_bytes)
+        self._log_size = valid_bytes
 
-    def query(self, vector, top_k):
+    def query(self, vector, top_k, min_score=None):
         """Query the vector store for similar vectors.
         
+        Args:
+            vector: Query vector
+            top_k: Maximum number of hits
+            min_score: Optional minimum similarity; weaker hits are dropped
+            
+        Returns:
+            List of (id, score, idx) tuples; pass idx to get_source, get_chunk_index
+            and get_text for the hit's metadata
+        """
+        ids, scores, indices = self.query_raw(vector, top_k, min_score)
+        return list(zip(ids, scores.tolist(), indices.tolist()))
+
+    def query_raw(self, vector, top_k, min_score=None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """Like query(), but return the hits column-wise without building tuples.
+        
         Returns:
-            List of (id, score, metadata) tuples
+            (ids, scores, indices): hit IDs plus float32 scores and int64 index
+            positions, best first
         """
-        v = np.array([vector]).astype('float32')
+        # Copy into this thread's buffer (cached query embeddings are read-only)
+        # and normalize like add_vectors
+        v = self._query_buffer()
+        v[0] = np.asarray(vector).reshape(-1)
+        faiss.normalize_L2(v)
         D, I = self.index.search(v, top_k)
-        results = []
-        for score, idx in zip(D[0], I[0]):
-            if idx == -1:
-                continue
-            if idx >= len(self.id_map) or idx >= len(self.metadatas):
-                logger.warning(f"Index {idx} out of bounds for id_map/metadatas")
-                continue
-                
-            # Ensure metadata is a dictionary
-            metadata = self.metadatas[idx] if isinstance(self.metadatas[idx], dict) else {}
-            
-            # Add text to metadata if it's not already there
-            if 'text' not in metadata and hasattr(self, 'texts') and idx < len(self.texts):
-                metadata['text'] = self.texts[idx]
-                
-            results.append((self.id_map[idx], float(score), metadata))
-            
-        return results
+        scores, indices = D[0], I[0]
+        
+        # FAISS returns hits best first, so filtering keeps them sorted
+        keep = indices != -1
+        if min_score is not None:
+            keep &= scores >= min_score
+        in_bounds = indices < min(len(self.id_map), len(self._texts))
+        if not in_bounds[keep].all():
+            logger.warning(f"Indices {indices[keep & ~in_bounds].tolist()} out of bounds for id_map/metadatas")
+        keep &= in_bounds
+        
+        scores, indices = scores[keep], indices[keep]
+        return [self.id_map[i] for i in indices.tolist()], scores, indices
@@ -4,33 +4,41 @@ Test cases for the /ask endpoint.
 import os
 import sys
 import pytest
-from unittest.mock import patch, AsyncMock
+from unittest.mock import MagicMock, AsyncMock
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from app.api.v1.endpoints import answer_cache, get_rag_service
 from .test_base import BaseTestAPI
 
 class TestAskQuestionAPI(BaseTestAPI):
     """Test cases for the /ask endpoint."""
     
+    @pytest.fixture(autouse=True)
+    def clear_answer_cache(self):
+        """Start every test with an empty answer cache."""
+        answer_cache.clear()
+        yield
+        answer_cache.clear()
+    
     def test_ask_question_success(self):
         """Test asking a question successfully."""
         test_question = "What is the test about?"
         
-        with patch("app.api.v1.endpoints.RAGService") as mock_rag_service:
-            mock_service = mock_rag_service.return_value
-            mock_service.answer_query = AsyncMock(
-                return_value=(
-                    "This is a test answer.", 
-                    [{"source": "Source 1"}, {"source": "Source 2"}]
-                )
-            )
-            
-            response = self.client.post(
-                "/api/v1/ask",
-                json={"question": test_question, "top_k": 3}
+        mock_service = self.override_dependency(get_rag_service, MagicMock())
+        mock_service.embed_query = AsyncMock(return_value=[1.0, 0.0, 0.0])
+        mock_service.answer_query = AsyncMock(
+            return_value=(
+                "This is a test answer.", 
+                [{"source": "Source 1"}, {"source": "Source 2"}]
             )
+        )
+        
+        response = self.client.post(
+            "/api/v1/ask",
+            json={"question": test_question, "top_k": 3}
+        )
         
         assert response.status_code == 200
         data = response.json()
@@ -38,6 +46,22 @@ class TestAskQuestionAPI(BaseTestAPI):
         assert len(data["sources"]) == 2
         assert data["sources"][0] == "Source 1"
 
+    def test_ask_question_served_from_cache(self):
+        """Test that a near-duplicate question reuses the cached answer."""
+        mock_service = self.override_dependency(get_rag_service, MagicMock())
+        mock_service.embed_query = AsyncMock(side_effect=[[1.0, 0.0, 0.0], [0.999, 0.01, 0.0]])
+        mock_service.answer_query = AsyncMock(
+            return_value=("Cached answer.", [{"source": "Source 1"}])
+        )
+        
+        first = self.client.post("/api/v1/ask", json={"question": "What is it?", "top_k": 3})
+        second = self.client.post("/api/v1/ask", json={"question": "What is it ?", "top_k": 3})
+        
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.json()["answer"] == "Cached answer."
+        assert mock_service.answer_query.await_count == 1
+
     def test_ask_question_missing_question(self):
         """Test asking with missing question."""
         response = self.client.post(
@@ -46,10 +70,10 @@ class TestAskQuestionAPI(BaseTestAPI):
         )
         assert response.status_code == 422  # Validation error
 
-    @patch("app.api.v1.endpoints.RAGService")
-    def test_ask_question_processing_error(self, mock_rag_service):
+    def test_ask_question_processing_error(self):
         """Test error during question processing."""
-        mock_service = mock_rag_service.return_value
+        mock_service = self.override_dependency(get_rag_service, MagicMock())
+        mock_service.embed_query = AsyncMock(return_value=[1.0, 0.0, 0.0])
         mock_service.answer_query = AsyncMock(side_effect=Exception("Processing failed"))
         
         response = self.client.post(
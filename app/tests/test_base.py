@@ -3,25 +3,54 @@ Base test class with common setup and utilities for API tests.
 """
 import os
 import sys
+import numpy as np
 import pytest
+from unittest.mock import MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from app.main import app
+from app.core.config import settings
+from app.services import ingestion
+from app.services.rag import RAGService
+
+def fake_embedding_provider(*args, **kwargs):
+    """Stand-in for HFEmbeddingProvider that returns constant 384-dim embeddings."""
+    provider = MagicMock()
+    provider.model_id = "test-model"
+    provider.embed_texts = AsyncMock(
+        side_effect=lambda texts: np.ones((len(texts), 384), dtype=np.float32)
+    )
+    return provider
 
 class BaseTestAPI:
     """Base test class with common setup and utilities."""
     
     @pytest.fixture(autouse=True)
-    def setup_method(self, tmp_path):
+    def setup_method(self, tmp_path, monkeypatch):
         """Common setup for all test methods."""
-        self.client = TestClient(app)
-        self.tmp_path = tmp_path
-        self.test_text = "This is a test document content for unit testing."
-        yield
-        # Teardown if needed
+        # Keep the services' data under tmp_path and don't load real models
+        data_dir = tmp_path / "data"
+        monkeypatch.setattr(settings, "vector_store_path", data_dir / "vector_store")
+        monkeypatch.setattr(settings, "query_embedding_cache_dir", data_dir / "query_embeddings")
+        monkeypatch.setattr(settings, "upload_dir", data_dir / "uploads")
+        monkeypatch.setattr(settings, "database_url", f"sqlite:///{data_dir / 'docask.db'}")
+        monkeypatch.setattr(ingestion, "HFEmbeddingProvider", fake_embedding_provider)
+        monkeypatch.setattr(RAGService, "warmup", lambda self: None)
+        
+        with TestClient(app) as client:  # runs the startup handlers
+            self.client = client
+            self.tmp_path = tmp_path
+            self.test_text = "This is a test document content for unit testing."
+            yield
+        app.dependency_overrides.clear()
+
+    def override_dependency(self, dependency, value):
+        """Helper to replace a FastAPI dependency with a fixed value."""
+        app.dependency_overrides[dependency] = lambda: value
+        return value
 
     def create_test_file(self, filename, content=None):
         """Helper to create a test file."""
@@ -0,0 +1,61 @@
+"""
+Test cases for the on-disk query embedding cache.
+"""
+import os
+import time
+import numpy as np
+
+from app.services.embed_cache import QueryEmbeddingCache
+
+
+class TestQueryEmbeddingCache:
+    """Test cases for QueryEmbeddingCache."""
+
+    def test_roundtrip(self, tmp_path):
+        """Test that a stored embedding is returned for the same query and model."""
+        cache = QueryEmbeddingCache(tmp_path)
+        embedding = np.arange(4, dtype=np.float32)
+
+        cache.put("what is faiss?", "model-a", embedding)
+
+        np.testing.assert_array_equal(cache.get("what is faiss?", "model-a"), embedding)
+
+    def test_key_includes_model(self, tmp_path):
+        """Test that embeddings of another model are never returned."""
+        cache = QueryEmbeddingCache(tmp_path)
+        cache.put("what is faiss?", "model-a", np.ones(4, dtype=np.float32))
+
+        assert cache.get("what is faiss?", "model-b") is None
+        assert cache.get("what is FAISS?", "model-a") is None
+
+    def test_expired_entry_is_dropped(self, tmp_path):
+        """Test that entries older than the TTL are treated as missing."""
+        cache = QueryEmbeddingCache(tmp_path, ttl=60)
+        cache.put("old query", "model-a", np.ones(4, dtype=np.float32))
+        path = cache._path(cache.key("old query", "model-a"))
+        stale = time.time() - 120
+        os.utime(path, (stale, stale))
+
+        assert cache.get("old query", "model-a") is None
+        assert not path.exists()
+
+    def test_sweep_removes_expired_and_oldest_entries(self, tmp_path):
+        """Test that sweep() deletes expired entries and keeps only the newest max_entries."""
+        writer = QueryEmbeddingCache(tmp_path)
+        now = time.time()
+        for i, age in enumerate([120, 30, 20, 10]):
+            writer.put(f"query {i}", "model-a", np.ones(4, dtype=np.float32))
+            path = writer._path(writer.key(f"query {i}", "model-a"))
+            os.utime(path, (now - age, now - age))
+        cache = QueryEmbeddingCache(tmp_path, ttl=60, max_entries=2)
+
+        assert cache.sweep() == 2
+        assert [cache.get(f"query {i}", "model-a") is not None for i in range(4)] == [False, False, True, True]
+
+    def test_puts_trigger_sweep(self, tmp_path):
+        """Test that the cache stays bounded without an explicit sweep()."""
+        cache = QueryEmbeddingCache(tmp_path, max_entries=20)
+        for i in range(50):
+            cache.put(f"query {i}", "model-a", np.ones(4, dtype=np.float32))
+
+        assert len(list(tmp_path.glob("*/*.npy"))) <= 22
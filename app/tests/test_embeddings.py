@@ -0,0 +1,96 @@
+"""
+Test cases for the embedding providers.
+"""
+import asyncio
+import numpy as np
+import pytest
+import torch
+from unittest.mock import MagicMock, AsyncMock
+
+from app.services.embeddings import AsyncEmbeddingBatcher, HFEmbeddingProvider
+
+
+@pytest.fixture
+def provider():
+    """Embedding provider that embeds each text as [len(text), 1]."""
+    provider = MagicMock()
+    provider.embed_texts = AsyncMock(
+        side_effect=lambda texts: np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+    )
+    return provider
+
+
+class TestAsyncEmbeddingBatcher:
+    """Test cases for AsyncEmbeddingBatcher."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_texts_share_one_batch(self, provider):
+        """Test that texts submitted together are embedded by one call."""
+        batcher = AsyncEmbeddingBatcher(provider, max_wait=0.05)
+
+        results = await asyncio.gather(*(batcher.submit(t) for t in ("a", "bb", "ccc")))
+
+        assert [r[0] for r in results] == [1, 2, 3]
+        provider.embed_texts.assert_awaited_once_with(["a", "bb", "ccc"])
+
+    @pytest.mark.asyncio
+    async def test_token_threshold_flushes_early(self, provider):
+        """Test that a batch is cut once it holds max_tokens tokens."""
+        batcher = AsyncEmbeddingBatcher(provider, max_wait=0.05, max_tokens=1)
+
+        await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+        assert provider.embed_texts.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self, provider):
+        """Test that a failed batch fails all of its futures and the batcher keeps working."""
+        provider.embed_texts.side_effect = [RuntimeError("boom"), np.ones((1, 2), dtype=np.float32)]
+        batcher = AsyncEmbeddingBatcher(provider, max_wait=0.05)
+
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        assert (await batcher.submit("c")).shape == (2,)
+
+
+class TestHFEmbeddingProvider:
+    """Test cases for HFEmbeddingProvider configuration."""
+
+    @pytest.mark.parametrize("backend", ["torch", "compile", "onnx", "onnx-int8"])
+    def test_supported_backends(self, backend):
+        """Test that every supported backend is accepted and part of the model ID."""
+        provider = HFEmbeddingProvider(backend=backend)
+
+        assert provider.model_id.endswith(f":{backend}")
+
+    def test_unsupported_backend(self):
+        """Test that an unknown backend is rejected."""
+        with pytest.raises(ValueError):
+            HFEmbeddingProvider(backend="tensorrt")
+
+    @pytest.mark.asyncio
+    async def test_embeddings_are_returned_in_input_order(self):
+        """Test that length-sorted, pipelined batches are scattered back to the input order."""
+        batches = []
+
+        def preprocess(texts):
+            batches.append(list(texts))
+            return {"lengths": torch.tensor([float(len(t)) for t in texts])}
+
+        model = MagicMock()
+        model.preprocess = preprocess
+        model.device = torch.device("cpu")
+        model.side_effect = lambda features: {
+            "sentence_embedding": torch.stack([features["lengths"], torch.ones_like(features["lengths"])], dim=1)
+        }
+        provider = HFEmbeddingProvider(batch_size=2)
+        provider._model = model
+        texts = ["ccc", "a", "eeeee", "bb", "dddd"]
+
+        embeddings = await provider.embed_texts(texts)
+
+        expected = np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+        expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+        np.testing.assert_allclose(embeddings, expected, rtol=1e-6)
+        assert batches == [["eeeee", "dddd"], ["ccc", "bb"], ["a"]]
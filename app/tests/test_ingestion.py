@@ -0,0 +1,87 @@
+"""
+Test cases for the ingestion service.
+"""
+import io
+import asyncio
+
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from starlette.datastructures import UploadFile
+
+from app.db.repo import DocumentHashRepository
+from app.services.ingestion import IngestionService
+from app.services.vector_store import FaissVectorStore
+
+
+def _upload(content: bytes, filename: str = "test.txt") -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename, size=len(content))
+
+
+@pytest.fixture
+def ingestor(tmp_path):
+    """IngestionService with a fake embedding provider and stores under tmp_path."""
+    embedding_provider = MagicMock()
+    embedding_provider.embed_texts = AsyncMock(
+        side_effect=lambda texts: np.ones((len(texts), 8), dtype=np.float32)
+    )
+    return IngestionService(
+        embedding_provider=embedding_provider,
+        vector_store=FaissVectorStore(dim=8, persist_path=str(tmp_path / "vs")),
+        cache_dir=tmp_path / "cache",
+        hash_repository=DocumentHashRepository(tmp_path / "docask.db")
+    )
+
+
+class TestIngestionService:
+    """Test cases for IngestionService."""
+
+    @pytest.mark.asyncio
+    async def test_ingest_file_adds_chunks(self, ingestor):
+        """Test that an uploaded file is chunked, embedded and stored."""
+        doc_id = await ingestor.ingest_file(_upload(b"DocAsk answers questions about documents."))
+        await ingestor.flush()
+
+        assert ingestor.vector_store.id_map == [f"{doc_id}_0"]
+        assert ingestor.vector_store.metadatas[0]["source"] == "test.txt"
+
+    @pytest.mark.asyncio
+    async def test_identical_upload_is_not_ingested_twice(self, ingestor):
+        """Test that re-uploading the same content returns the existing document."""
+        content = b"DocAsk answers questions about documents."
+        first = await ingestor.ingest_file(_upload(content))
+        second = await ingestor.ingest_file(_upload(content, filename="copy.txt"))
+        await ingestor.flush()
+
+        assert second == first
+        assert ingestor.embedding_provider.embed_texts.await_count == 1
+        assert ingestor.vector_store.index.ntotal == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_uploads_are_ingested_once(self, ingestor):
+        """Test that identical uploads in flight at the same time share one ingestion."""
+        content = b"DocAsk answers questions about documents."
+        first, second = await asyncio.gather(
+            ingestor.ingest_file(_upload(content)),
+            ingestor.ingest_file(_upload(content, filename="copy.txt"))
+        )
+        await ingestor.flush()
+
+        assert second == first
+        assert ingestor.embedding_provider.embed_texts.await_count == 1
+        assert ingestor.vector_store.index.ntotal == 1
+        assert not ingestor._in_flight
+
+    @pytest.mark.asyncio
+    async def test_cached_embeddings_restore_missing_document(self, ingestor, tmp_path):
+        """Test that cached chunks are re-added without re-embedding when the store lost them."""
+        content = b"DocAsk answers questions about documents."
+        doc_id = await ingestor.ingest_file(_upload(content))
+        await ingestor.flush()
+        ingestor.vector_store = FaissVectorStore(dim=8, persist_path=str(tmp_path / "empty"))
+
+        assert await ingestor.ingest_file(_upload(content)) == doc_id
+        await ingestor.flush()
+
+        assert ingestor.embedding_provider.embed_texts.await_count == 1
+        assert ingestor.vector_store.id_map == [f"{doc_id}_0"]
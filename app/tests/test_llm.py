@@ -0,0 +1,130 @@
+"""
+Test cases for the LLM clients.
+"""
+import json
+import re
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+import torch
+
+from app.services.llm import HuggingFaceLLM, RemoteLLM
+
+
+class FakeTokenizer:
+    """Word-level tokenizer that, like GPT-2's, keeps leading whitespace on a token."""
+
+    eos_token_id = 0
+
+    def __init__(self):
+        self.vocab = {}
+
+    def __call__(self, text, return_tensors=None, **kwargs):
+        ids = [self.vocab.setdefault(t, len(self.vocab) + 1) for t in re.findall(r"\s*\S+|\s+", text)]
+        return {"input_ids": torch.tensor([ids])}
+
+    def decode(self, ids, skip_special_tokens=False):
+        tokens = {i: t for t, i in self.vocab.items()}
+        return "".join(tokens.get(int(i), "") for i in ids)
+
+
+@pytest.fixture
+def hf_llm():
+    """HuggingFaceLLM with a fake tokenizer and a model that echoes its input plus one token."""
+    llm = HuggingFaceLLM(compile_model=False, device="cpu")
+    llm.tokenizer = FakeTokenizer()
+    llm.model = MagicMock()
+    llm.model.config = SimpleNamespace(max_position_embeddings=1024)
+    answer_id = llm.tokenizer(" answer")["input_ids"][0, 0]
+    llm.model.generate.side_effect = lambda input_ids, **kwargs: torch.cat(
+        [input_ids, torch.tensor([[answer_id]])], dim=1
+    )
+    return llm
+
+
+class TestHuggingFaceLLM:
+    """Test cases for HuggingFaceLLM."""
+
+    @pytest.mark.asyncio
+    async def test_prefix_cache_is_computed_once_and_copied(self, hf_llm):
+        """Test that the prefix KV cache is built once and each generate() gets its own copy."""
+        first = await hf_llm.generate("Answer from context. Question: one?", prefix="Answer from context.")
+        await hf_llm.generate("Answer from context. Question: two?", prefix="Answer from context.")
+
+        assert first == "answer"
+        assert hf_llm.model.call_count == 1
+        (_, cache), = hf_llm._prefix_cache.items()
+        passed = [c.kwargs["past_key_values"] for c in hf_llm.model.generate.call_args_list]
+        assert passed[0] is not cache and passed[1] is not cache and passed[0] is not passed[1]
+        input_ids = hf_llm.model.generate.call_args.kwargs["input_ids"]
+        assert torch.equal(input_ids, hf_llm.tokenizer("Answer from context. Question: two?")["input_ids"])
+
+    @pytest.mark.asyncio
+    async def test_prefix_not_on_token_boundary_is_not_cached(self, hf_llm):
+        """Test that a prefix whose tokens differ inside the full prompt is not reused."""
+        await hf_llm.generate("Answer from context. Question: one?", prefix="Answer from context. ")
+
+        assert "past_key_values" not in hf_llm.model.generate.call_args.kwargs
+
+    @pytest.mark.asyncio
+    async def test_greedy_decoding_by_default(self, hf_llm):
+        """Test that generation is greedy unless the caller overrides it."""
+        await hf_llm.generate("Question: one?")
+        assert hf_llm.model.generate.call_args.kwargs["do_sample"] is False
+
+        await hf_llm.generate("Question: one?", do_sample=True)
+        assert hf_llm.model.generate.call_args.kwargs["do_sample"] is True
+
+
+class TestRemoteLLM:
+    """Test cases for RemoteLLM."""
+
+    @pytest.mark.asyncio
+    async def test_generate_posts_completion_request(self):
+        """Test that generate() calls the completions endpoint and returns the text."""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"choices": [{"text": " The answer. "}]})
+
+        client = httpx.AsyncClient(base_url="http://llm", transport=httpx.MockTransport(handler))
+        llm = RemoteLLM("http://llm", model_name="gpt2", client=client)
+
+        answer = await llm.generate("Question: what?", prefix="Question:")
+
+        assert answer == "The answer."
+        assert requests[0].url.path == "/v1/completions"
+        payload = json.loads(requests[0].content)
+        assert payload["prompt"] == "Question: what?"
+        assert payload["temperature"] == 0
+        await llm.aclose()
+
+    @pytest.mark.asyncio
+    async def test_generate_returns_error_message_on_failure(self):
+        """Test that server errors are reported in the returned text."""
+        client = httpx.AsyncClient(
+            base_url="http://llm",
+            transport=httpx.MockTransport(lambda request: httpx.Response(503))
+        )
+        llm = RemoteLLM("http://llm", client=client)
+
+        answer = await llm.generate("Question: what?")
+
+        assert answer.startswith("Error generating response")
+        await llm.aclose()
+
+    @pytest.mark.asyncio
+    async def test_client_is_closed_at_shutdown(self, monkeypatch):
+        """Test that the app's shutdown hook closes the remote LLM's HTTP client."""
+        from app.main import app, close_llm_client
+
+        client = httpx.AsyncClient(base_url="http://llm")
+        monkeypatch.setattr(app.state, "rag", SimpleNamespace(llm=RemoteLLM("http://llm", client=client)),
+                            raising=False)
+
+        await close_llm_client()
+
+        assert client.is_closed
@@ -0,0 +1,54 @@
+"""
+Test cases for the semantic answer cache.
+"""
+import time
+
+import numpy as np
+
+from app.services.query_cache import SemanticAnswerCache
+
+
+class TestSemanticAnswerCache:
+    """Test cases for SemanticAnswerCache."""
+
+    def test_similar_query_hits(self):
+        """Test that a near-identical embedding returns the cached answer."""
+        cache = SemanticAnswerCache(threshold=0.97)
+        cache.store([1.0, 0.0, 0.0], 3, "answer", [{"source": "a.txt"}])
+
+        assert cache.lookup([0.99, 0.05, 0.0], 3) == ("answer", [{"source": "a.txt"}])
+
+    def test_dissimilar_query_misses(self):
+        """Test that an unrelated embedding is a miss."""
+        cache = SemanticAnswerCache(threshold=0.97)
+        cache.store([1.0, 0.0, 0.0], 3, "answer", [])
+
+        assert cache.lookup([0.0, 1.0, 0.0], 3) is None
+
+    def test_different_top_k_misses(self):
+        """Test that entries only match queries with the same top_k."""
+        cache = SemanticAnswerCache()
+        cache.store([1.0, 0.0, 0.0], 3, "answer", [])
+
+        assert cache.lookup([1.0, 0.0, 0.0], 5) is None
+
+    def test_expired_entry_misses(self):
+        """Test that entries older than the TTL are not returned."""
+        cache = SemanticAnswerCache(ttl=0.01)
+        cache.store([1.0, 0.0, 0.0], 3, "answer", [])
+        time.sleep(0.02)
+
+        assert cache.lookup([1.0, 0.0, 0.0], 3) is None
+
+    def test_least_recently_used_is_evicted(self):
+        """Test LRU eviction once max_size is reached."""
+        cache = SemanticAnswerCache(max_size=2)
+        cache.store(np.array([1.0, 0.0, 0.0]), 3, "first", [])
+        cache.store(np.array([0.0, 1.0, 0.0]), 3, "second", [])
+        cache.lookup([1.0, 0.0, 0.0], 3)  # "first" becomes most recently used
+        cache.store(np.array([0.0, 0.0, 1.0]), 3, "third", [])
+
+        assert len(cache) == 2
+        assert cache.lookup([1.0, 0.0, 0.0], 3) == ("first", [])
+        assert cache.lookup([0.0, 1.0, 0.0], 3) is None
+        assert cache.lookup([0.0, 0.0, 1.0], 3) == ("third", [])
@@ -0,0 +1,132 @@
+"""
+Test cases for the RAG service.
+"""
+import numpy as np
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+
+from app.services.rag import RAGService, PROMPT_PREFIX, PROMPT_CONTEXTS, PROMPT_QUESTION, PROMPT_SUFFIX
+from app.services.embed_cache import QueryEmbeddingCache
+
+
+@pytest.fixture
+def rag(tmp_path):
+    """RAGService with a mocked embedding provider, vector store and LLM."""
+    embedding_provider = MagicMock()
+    embedding_provider.model_id = "test-model:torch"
+    embedding_provider.embed_texts = AsyncMock(
+        side_effect=lambda texts: np.ones((len(texts), 4), dtype=np.float32)
+    )
+    return RAGService(emb_provider=embedding_provider, vector_store=MagicMock(), llm_client=MagicMock(),
+                      embedding_cache=QueryEmbeddingCache(tmp_path))
+
+
+class TestEmbedQuery:
+    """Test cases for RAGService.embed_query."""
+
+    @pytest.mark.asyncio
+    async def test_repeated_query_is_embedded_once(self, rag):
+        """Test that identical queries (up to whitespace) reuse the cached embedding."""
+        first = await rag.embed_query("What is DocAsk?")
+        second = await rag.embed_query("  What  is DocAsk? ")
+
+        assert second is first
+        assert rag.embedding_provider.embed_texts.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_cache_evicts_least_recently_used(self, rag):
+        """Test that the cache never grows beyond its maximum size."""
+        rag._query_embeddings_max_size = 2
+        for query in ("one", "two", "three"):
+            await rag.embed_query(query)
+
+        await rag.embed_query("one")
+
+        assert len(rag._query_embeddings) == 2
+        assert rag.embedding_provider.embed_texts.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_embeddings_persist_on_disk(self, rag):
+        """Test that a new service finds embeddings computed by an earlier one."""
+        await rag.embed_query("What is DocAsk?")
+
+        restarted = RAGService(emb_provider=rag.embedding_provider, vector_store=MagicMock(),
+                               llm_client=MagicMock(), embedding_cache=rag.embedding_cache)
+        embedding = await restarted.embed_query("What is DocAsk?")
+
+        np.testing.assert_array_equal(embedding, np.ones(4, dtype=np.float32))
+        assert rag.embedding_provider.embed_texts.await_count == 1
+
+
+class TestWarmup:
+    """Test cases for RAGService.warmup."""
+
+    def test_warmup_precomputes_prompt_prefix(self, rag):
+        """Test that warmup hands the static prompt prefix to the LLM."""
+        rag.warmup()
+
+        rag.llm.warmup.assert_called_once_with(PROMPT_PREFIX)
+
+
+class TestIsAnswerGrounded:
+    """Test cases for RAGService._is_answer_grounded."""
+
+    def test_answer_from_context_is_grounded(self, rag):
+        """Test that an answer built from context words passes, ignoring punctuation."""
+        contexts = ["FAISS is a library for efficient similarity search.", "It was written by Meta."]
+
+        assert rag._is_answer_grounded("FAISS is a similarity search library.", contexts)
+
+    def test_unrelated_answer_is_not_grounded(self, rag):
+        """Test that an answer sharing few words with the contexts fails."""
+        contexts = ["FAISS is a library for efficient similarity search."]
+
+        assert not rag._is_answer_grounded("Bananas grow quickly in tropical climates.", contexts)
+
+    def test_non_ascii_answer_is_grounded(self, rag):
+        """Test that answers in non-Latin scripts or with accented words are matched."""
+        assert rag._is_answer_grounded("東京は日本の首都です", ["東京は日本の首都です"])
+        assert rag._is_answer_grounded("Le café crème.", ["Un café crème, s'il vous plaît."])
+        assert not rag._is_answer_grounded("Le thé vert.", ["Un café crème, s'il vous plaît."])
+
+    def test_refusal_is_not_grounded(self, rag):
+        """Test that refusals are rejected."""
+        assert not rag._is_answer_grounded("I don't know", ["FAISS is a library."])
+
+    def test_generic_answer_is_not_grounded(self, rag):
+        """Test that an answer containing a generic indicator fails even if it overlaps the context."""
+        contexts = ["FAISS is a library for efficient similarity search."]
+
+        assert not rag._is_answer_grounded("I'm sorry, FAISS similarity search library.", contexts)
+
+
+class TestFormatHit:
+    """Test cases for RAGService._format_hit."""
+
+    def test_text_is_looked_up_by_index_position(self, rag):
+        """Test that the hit's idx is used to fetch its text."""
+        rag.vs.get_text.return_value = "chunk text"
+
+        assert rag._format_hit(("doc_3", 0.9, 3)) == "chunk text"
+        rag.vs.get_text.assert_called_once_with(3)
+
+
+class TestBuildPrompt:
+    """Test cases for RAGService._build_prompt."""
+
+    def test_contexts_and_query_are_inserted_verbatim(self, rag):
+        """Test that braces in contexts or the query are not treated as placeholders."""
+        prompt = rag._build_prompt("What is {x}?", ["uses {0} and }{", "second"])
+
+        assert prompt == (
+            f"{PROMPT_PREFIX}{PROMPT_CONTEXTS}Context 1: uses {{0}} and }}{{\n\nContext 2: second"
+            f"{PROMPT_QUESTION}What is {{x}}?{PROMPT_SUFFIX}"
+        )
+
+    def test_template_is_built_once_per_context_count(self, rag):
+        """Test that prompts with the same number of contexts share one template."""
+        rag._build_prompt("q1", ["a", "b"])
+        rag._build_prompt("q2", ["c", "d"])
+        rag._build_prompt("q3", ["e"])
+
+        assert sorted(rag._prompt_templates) == [1, 2]
@@ -0,0 +1,36 @@
+"""
+Test cases for the text processing utilities.
+"""
+import pytest
+
+from app.utils.text import chunk_offsets, chunk_text
+
+
+class TestChunkText:
+    """Test cases for chunk_text and chunk_offsets."""
+
+    def test_short_text_is_single_chunk(self):
+        """Test that text shorter than chunk_size is not split."""
+        assert chunk_text("  hello   world  ", chunk_size=100, overlap=10) == ["hello world"]
+
+    def test_chunks_overlap(self):
+        """Test that consecutive chunks share `overlap` characters."""
+        text = "abcdefghijklmnopqrstuvwxyz"
+        chunks = chunk_text(text, chunk_size=10, overlap=4)
+
+        assert chunks == ["abcdefghij", "ghijklmnop", "mnopqrstuv", "stuvwxyz"]
+
+    def test_chunk_offsets_cover_text(self):
+        """Test that offsets start at 0, end at the text length and step by chunk_size - overlap."""
+        offsets = chunk_offsets(2600, 1000, 200).tolist()
+
+        assert offsets == [[0, 1000], [800, 1800], [1600, 2600]]
+
+    def test_empty_text(self):
+        """Test that blank text produces no chunks."""
+        assert chunk_text(" \n\t ") == []
+
+    def test_overlap_must_be_smaller_than_chunk_size(self):
+        """Test that an overlap that would never advance is rejected."""
+        with pytest.raises(ValueError):
+            chunk_text("some text", chunk_size=10, overlap=10)
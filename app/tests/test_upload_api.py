@@ -4,11 +4,13 @@ Test cases for the /upload endpoint.
 import os
 import sys
 import pytest
-from unittest.mock import patch, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
 # Add the project root to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from app.api.v1.endpoints import get_ingestion_service
+from app.core.config import settings
 from .test_base import BaseTestAPI
 
 class TestUploadDocumentAPI(BaseTestAPI):
@@ -35,10 +37,9 @@ class TestUploadDocumentAPI(BaseTestAPI):
         response = self.client.post("/api/v1/upload", files={})
         assert response.status_code == 422  # Validation error
 
-    @patch("app.api.v1.endpoints.IngestionService")
-    def test_upload_document_processing_error(self, mock_ingestion_service):
+    def test_upload_document_processing_error(self):
         """Test error during document processing."""
-        mock_service = mock_ingestion_service.return_value
+        mock_service = self.override_dependency(get_ingestion_service, MagicMock())
         mock_service.ingest_file = AsyncMock(side_effect=Exception("Processing failed"))
         
         test_file = self.create_test_file("test.txt")
@@ -52,6 +53,44 @@ class TestUploadDocumentAPI(BaseTestAPI):
         assert response.status_code == 500
         assert "Error processing document" in response.json()["detail"]
 
+    def test_upload_document_too_large(self):
+        """Test that files above the upload size limit are rejected."""
+        test_file = self.create_test_file("test.txt")
+        
+        with patch.object(settings, "max_upload_mb", 0), open(test_file, "rb") as f:
+            response = self.client.post(
+                "/api/v1/upload",
+                files={"file": ("test.txt", f, "text/plain")}
+            )
+        
+        assert response.status_code == 413
+        assert "maximum upload size" in response.json()["detail"]
+
+    def test_upload_batch_reports_status_per_file(self):
+        """Test that a batch upload returns one status per file, in order."""
+        mock_service = self.override_dependency(get_ingestion_service, MagicMock())
+        mock_service.ingest_file = AsyncMock(side_effect=["doc-1", Exception("Processing failed")])
+        
+        first = self.create_test_file("first.txt")
+        second = self.create_test_file("second.txt")
+        
+        with open(first, "rb") as f1, open(second, "rb") as f2:
+            response = self.client.post(
+                "/api/v1/upload_batch",
+                files=[
+                    ("files", ("first.txt", f1, "text/plain")),
+                    ("files", ("second.txt", f2, "text/plain")),
+                ]
+            )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert [d["filename"] for d in data] == ["first.txt", "second.txt"]
+        assert data[0]["status"] == "ingested"
+        assert data[0]["document_id"] == "doc-1"
+        assert data[1]["status"] == "failed"
+        assert data[1]["message"] == "Processing failed"
+
     @pytest.mark.parametrize("filename,content_type,test_content", [
         ("test.pdf", "application/pdf", "This is a test PDF document."),
         ("test.txt", "text/plain", "This is a test text file."),
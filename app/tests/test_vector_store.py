@@ -0,0 +1,269 @@
+"""
+Test cases for the FAISS vector store.
+"""
+import pickle
+import faiss
+import numpy as np
+import pytest
+
+from app.services.vector_store import FaissVectorStore
+
+
+def _random_unit_vectors(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _metadata(n):
+    return [{"source": "test.txt", "chunk_index": i} for i in range(n)]
+
+
+class TestFaissVectorStore:
+    """Test cases for FaissVectorStore."""
+
+    def test_query_returns_nearest_vector(self, tmp_path):
+        """Test that the closest stored vector is returned first."""
+        vectors = _random_unit_vectors(20, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors([f"id_{i}" for i in range(20)], vectors, _metadata(20))
+
+        hits = store.query(vectors[7], top_k=3)
+
+        assert hits[0][0] == "id_7"
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_scores_are_cosine_for_unnormalized_vectors(self, tmp_path):
+        """Test that vectors are normalized on add and query without touching the inputs."""
+        vectors = _random_unit_vectors(5, 8) * 3.0
+        query = vectors[2] * 0.5
+        query.setflags(write=False)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors([f"id_{i}" for i in range(5)], vectors, _metadata(5))
+
+        hit = store.query(query, top_k=1)[0]
+
+        assert hit[0] == "id_2"
+        assert hit[1] == pytest.approx(1.0, abs=1e-5)
+        assert np.linalg.norm(vectors[0]) == pytest.approx(3.0, abs=1e-5)
+
+    def test_query_min_score(self, tmp_path):
+        """Test that hits below min_score are dropped and the rest stay sorted."""
+        vectors = _random_unit_vectors(20, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors([f"id_{i}" for i in range(20)], vectors, _metadata(20))
+
+        hits = store.query(vectors[3], top_k=20, min_score=0.2)
+
+        scores = [score for _, score, _ in hits]
+        assert hits[0][0] == "id_3"
+        assert scores == sorted(scores, reverse=True)
+        assert all(score >= 0.2 for score in scores)
+        assert len(hits) < 20
+
+    def test_query_raw_matches_query(self, tmp_path):
+        """Test that query_raw returns the same hits column-wise."""
+        vectors = _random_unit_vectors(20, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors([f"id_{i}" for i in range(20)], vectors, _metadata(20))
+
+        ids, scores, indices = store.query_raw(vectors[5], top_k=4)
+
+        assert list(zip(ids, scores.tolist(), indices.tolist())) == store.query(vectors[5], top_k=4)
+        assert ids[0] == "id_5" and indices[0] == 5
+
+    def test_hit_metadata_columns(self, tmp_path):
+        """Test that a hit's idx resolves source, chunk index and text, also after reload."""
+        vectors = _random_unit_vectors(3, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors(["a_0", "a_1", "b_0"], vectors,
+                          [{"source": "a.txt", "chunk_index": 0}, {"source": "a.txt", "chunk_index": 1},
+                           {"source": "b.txt", "chunk_index": 0}],
+                          texts=["first", "second", "third"])
+
+        for s in (store, FaissVectorStore(dim=8, persist_path=str(tmp_path))):
+            _, _, idx = s.query(vectors[1], top_k=1)[0]
+            assert (s.get_source(idx), s.get_chunk_index(idx), s.get_text(idx)) == ("a.txt", 1, "second")
+            assert s.has_id("b_0") and not s.has_id("c_0")
+
+    def test_fp16_index_used_from_start(self, tmp_path):
+        """Test that an fp16 store needs no training and survives a reload."""
+        vectors = _random_unit_vectors(10, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path), index_type="fp16")
+        store.add_vectors([f"id_{i}" for i in range(10)], vectors, _metadata(10))
+
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path), index_type="fp16")
+        for s in (store, reloaded):
+            assert isinstance(s.index, faiss.IndexScalarQuantizer)
+            hit = s.query(vectors[4], top_k=1)[0]
+            assert hit[0] == "id_4"
+            assert hit[1] == pytest.approx(1.0, abs=1e-3)
+
+    def test_quantized_index_built_after_train_size(self, tmp_path):
+        """Test that a sq8 store stays exact until it has enough training vectors."""
+        vectors = _random_unit_vectors(300, 16)
+        store = FaissVectorStore(dim=16, persist_path=str(tmp_path), index_type="sq8", train_size=200)
+
+        store.add_vectors([f"id_{i}" for i in range(100)], vectors[:100], _metadata(100))
+        assert isinstance(store.index, faiss.IndexFlat)
+
+        store.add_vectors([f"id_{i}" for i in range(100, 300)], vectors[100:], _metadata(200))
+        assert isinstance(store.index, faiss.IndexScalarQuantizer)
+        assert store.index.ntotal == 300
+        assert store.query(vectors[150], top_k=1)[0][0] == "id_150"
+
+    def test_hnsw_index_used_from_start(self, tmp_path):
+        """Test that a hnsw store adds vectors to an HNSW graph without training."""
+        vectors = _random_unit_vectors(200, 16)
+        store = FaissVectorStore(dim=16, persist_path=str(tmp_path), index_type="hnsw",
+                                 train_size=10000, ef_search=32)
+        assert isinstance(store.index, faiss.IndexHNSW)
+
+        store.add_vectors([f"id_{i}" for i in range(200)], vectors, _metadata(200))
+
+        assert store.index.hnsw.efConstruction == 200
+        assert store.index.hnsw.efSearch == 32
+        assert store.query(vectors[42], top_k=1)[0][0] == "id_42"
+
+    def test_ivfpq_index_built_after_train_size(self, tmp_path):
+        """Test that an ivfpq store is trained once and keeps its nprobe after reload."""
+        vectors = _random_unit_vectors(512, 32)
+        store = FaissVectorStore(dim=32, persist_path=str(tmp_path), index_type="ivfpq",
+                                 train_size=512, nprobe=256)
+        store.add_vectors([f"id_{i}" for i in range(512)], vectors, _metadata(512))
+
+        assert isinstance(store.index, faiss.IndexIVFPQ)
+        assert store.index.is_trained
+        assert store.query(vectors[42], top_k=1)[0][0] == "id_42"
+
+        reloaded = FaissVectorStore(dim=32, persist_path=str(tmp_path), index_type="ivfpq", nprobe=4)
+        assert isinstance(reloaded.index, faiss.IndexIVFPQ)
+        assert reloaded.index.nprobe == 4
+
+    def test_flat_store_migrates_to_direct_index_type(self, tmp_path):
+        """Test that a store saved flat is rebuilt as HNSW on its next add."""
+        vectors = _random_unit_vectors(10, 8)
+        FaissVectorStore(dim=8, persist_path=str(tmp_path)).add_vectors(
+            [f"id_{i}" for i in range(5)], vectors[:5], _metadata(5))
+
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path), index_type="hnsw")
+        store.add_vectors([f"id_{i}" for i in range(5, 10)], vectors[5:], _metadata(5))
+
+        assert isinstance(store.index, faiss.IndexHNSW)
+        assert store.index.ntotal == 10
+        assert store.query(vectors[2], top_k=1)[0][0] == "id_2"
+
+    def test_deferred_flush(self, tmp_path):
+        """Test that add_vectors(flush=False) only reaches disk on flush()."""
+        vectors = _random_unit_vectors(5, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors([f"id_{i}" for i in range(5)], vectors, _metadata(5), flush=False)
+
+        assert FaissVectorStore(dim=8, persist_path=str(tmp_path)).index.ntotal == 0
+
+        store.flush()
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert reloaded.index.ntotal == 5
+        assert reloaded.id_map == [f"id_{i}" for i in range(5)]
+
+    def test_metadata_log_is_append_only(self, tmp_path):
+        """Test that each save appends only new records and a torn last line is dropped."""
+        vectors = _random_unit_vectors(6, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors(["id_0", "id_1"], vectors[:2], _metadata(2), texts=["zero", "one"])
+        first = (tmp_path / "meta.jsonl").read_bytes()
+        store.add_vectors(["id_2", "id_3"], vectors[2:4], _metadata(2), texts=["two", "three"])
+
+        log = (tmp_path / "meta.jsonl").read_bytes()
+        assert log.startswith(first) and log.count(b"\n") == 4
+
+        with open(tmp_path / "meta.jsonl", "ab") as f:
+            f.write(b'{"id": "id_4", "m"')
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert reloaded.id_map == ["id_0", "id_1", "id_2", "id_3"]
+        assert reloaded.get_text(3) == "three"
+        assert (tmp_path / "meta.jsonl").read_bytes() == log
+
+    def test_failed_save_leaves_no_partial_records(self, tmp_path):
+        """Test that records written by a failed save are dropped before the next one."""
+        vectors = _random_unit_vectors(3, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors(["a"], vectors[:1], _metadata(1))
+
+        with pytest.raises(TypeError):
+            store.add_vectors(["b", "c"], vectors[1:], [{"source": "b.txt"}, {"source": object()}])
+        store.metadatas[2] = {"source": "c.txt"}
+        store.flush()
+
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert reloaded.id_map == ["a", "b", "c"]
+        assert reloaded.get_source(2) == "c.txt"
+
+    def test_unreadable_store_is_not_overwritten(self, tmp_path):
+        """Test that a store that fails to load raises instead of starting empty."""
+        vectors = _random_unit_vectors(2, 8)
+        FaissVectorStore(dim=8, persist_path=str(tmp_path)).add_vectors(["a", "b"], vectors, _metadata(2))
+        log = (tmp_path / "meta.jsonl").read_bytes()
+        (tmp_path / "meta.jsonl").write_bytes(b"garbage\n" + log)
+
+        with pytest.raises(RuntimeError):
+            FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert (tmp_path / "meta.jsonl").read_bytes() == b"garbage\n" + log
+
+    def test_metadata_without_vectors_is_dropped(self, tmp_path):
+        """Test that records saved after the index was last written are truncated on load."""
+        vectors = _random_unit_vectors(3, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors(["a", "b"], vectors[:2], _metadata(2))
+        index = (tmp_path / "index.faiss").read_bytes()
+        store.add_vectors(["c"], vectors[2:], _metadata(1))
+        (tmp_path / "index.faiss").write_bytes(index)
+
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert reloaded.id_map == ["a", "b"]
+        reloaded.add_vectors(["d"], vectors[2:], _metadata(1))
+        assert FaissVectorStore(dim=8, persist_path=str(tmp_path)).id_map == ["a", "b", "d"]
+
+    def test_vectors_without_metadata_block_adds(self, tmp_path):
+        """Test that a store with more vectors than metadata refuses to add more."""
+        vectors = _random_unit_vectors(3, 8)
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        store.add_vectors(["a", "b"], vectors[:2], _metadata(2))
+        log = (tmp_path / "meta.jsonl").read_bytes()
+        (tmp_path / "meta.jsonl").write_bytes(log[:log.index(b"\n") + 1])
+
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        with pytest.raises(RuntimeError):
+            reloaded.add_vectors(["c"], vectors[2:], _metadata(1))
+        assert reloaded.index.ntotal == 2
+
+    def test_legacy_pickle_store_is_migrated(self, tmp_path):
+        """Test that a store saved as metadata.pkl loads and is rewritten as meta.jsonl."""
+        vectors = _random_unit_vectors(2, 8)
+        index = faiss.IndexFlatIP(8)
+        index.add(vectors)
+        faiss.write_index(index, str(tmp_path / "index.faiss"))
+        with open(tmp_path / "metadata.pkl", "wb") as f:
+            pickle.dump({"id_map": ["a", "b"], "metadatas": _metadata(2), "dim": 8,
+                         "texts": ["first", "second"]}, f)
+
+        store = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert store.get_text(1) == "second"
+        store.flush()
+
+        (tmp_path / "metadata.pkl").unlink()
+        reloaded = FaissVectorStore(dim=8, persist_path=str(tmp_path))
+        assert reloaded.id_map == ["a", "b"]
+        assert (reloaded.get_source(1), reloaded.get_text(1)) == ("test.txt", "second")
+
+    def test_ivfpq_train_size_too_small(self, tmp_path):
+        """Test that an ivfpq store refuses a train_size it could never train on."""
+        with pytest.raises(ValueError):
+            FaissVectorStore(dim=32, persist_path=str(tmp_path), index_type="ivfpq", train_size=100)
+        with pytest.raises(ValueError):
+            FaissVectorStore(dim=8, persist_path=str(tmp_path), index_type="flat", train_size=0)
+
+    def test_unsupported_index_type(self, tmp_path):
+        """Test that an unknown index type is rejected."""
+        with pytest.raises(ValueError):
+            FaissVectorStore(dim=8, persist_path=str(tmp_path), index_type="unknown")
@@ -1,5 +1,6 @@
 import io
 import os
+import shutil
 import logging
 from pathlib import Path
 from typing import Optional, Tuple
@@ -7,6 +8,11 @@ from typing import Optional, Tuple
 import PyPDF2
 from docx import Document
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:  # PyMuPDF is optional, fall back to PyPDF2
+    fitz = None
+
 logger = logging.getLogger(__name__)
 
 def extract_text_from_file(file_path: str) -> Tuple[str, Optional[str]]:
@@ -40,8 +46,12 @@ def extract_text_from_file(file_path: str) -> Tuple[str, Optional[str]]:
         return "", str(e)
 
 def _extract_text_from_pdf(file_obj) -> str:
-    """Extract text from a PDF file."""
+    """Extract text from a PDF file (with PyMuPDF's C parser when installed)."""
     try:
+        if fitz is not None:
+            with fitz.open(stream=file_obj.read(), filetype="pdf") as doc:
+                return "\n".join(page.get_text("text") for page in doc)
+            
         pdf_reader = PyPDF2.PdfReader(file_obj)
         text = []
         for page in pdf_reader.pages:
@@ -61,13 +71,13 @@ def _extract_text_from_docx(file_obj) -> str:
         return ""
 
 def save_uploaded_file(upload_file, upload_dir: Path) -> Optional[Path]:
-    """Save an uploaded file to disk."""
+    """Save an uploaded file to disk, streaming it in 1 MiB chunks."""
     try:
         upload_dir.mkdir(parents=True, exist_ok=True)
         file_path = upload_dir / upload_file.filename
         
         with open(file_path, 'wb') as f:
-            f.write(upload_file.file.read())
+            shutil.copyfileobj(upload_file.file, f, length=1 << 20)
             
         return file_path
     except Exception as e:
@@ -1,19 +1,58 @@
 """
 Utility functions for text processing:
 - clean_text: normalize whitespace, remove control chars
+- chunk_offsets: compute (start, end) offsets of overlapping chunks
 - chunk_text: split long text into overlapping chunks
 """
 
 import re
 from typing import List
 
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, fall back to plain Python
+    njit = None
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
 
 def clean_text(text: str) -> str:
     """Clean text by removing extra whitespace and invisible characters."""
-    text = re.sub(r"\s+", " ", text)
+    text = _WHITESPACE_RE.sub(" ", text)
     return text.strip()
 
 
+def _chunk_offsets(text_length: int, chunk_size: int, overlap: int) -> np.ndarray:
+    """
+    Compute the character offsets of overlapping chunks.
+
+    Args:
+        text_length: Length of the text to split.
+        chunk_size: Max characters per chunk.
+        overlap: Number of characters overlapped between chunks.
+
+    Returns:
+        Array of shape (n_chunks, 2) with the (start, end) offset of each chunk.
+    """
+    step = chunk_size - overlap
+    if text_length <= chunk_size:
+        count = 1
+    else:
+        count = (text_length - chunk_size + step - 1) // step + 1
+
+    offsets = np.empty((count, 2), dtype=np.int64)
+    for i in range(count):
+        start = i * step
+        offsets[i, 0] = start
+        offsets[i, 1] = min(start + chunk_size, text_length)
+    return offsets
+
+
+chunk_offsets = njit(cache=True)(_chunk_offsets) if njit is not None else _chunk_offsets
+
+
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     """
     Split text into overlapping chunks for embedding.
@@ -26,20 +65,11 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[st
     Returns:
         List of text chunks.
     """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+
     text = clean_text(text)
     if not text:
         return []
 
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        end = min(start + chunk_size, text_length)
-        chunk = text[start:end].strip()
-        chunks.append(chunk)
-        if end == text_length:
-            break
-        start = end - overlap  # step back for overlap
-
-    return chunks
+    return [text[start:end].strip() for start, end in chunk_offsets(len(text), chunk_size, overlap).tolist()]